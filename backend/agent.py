@@ -0,0 +1,241 @@
+import os
+import json
+from zoneinfo import ZoneInfo
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, Field, ValidationError
+from tzlocal import get_localzone
+from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
+from calendar_client import get_service
+from calendar_update import patch_event
+from event_store import get_event_store, write_through, PRIMARY_EVENTS_URL
+from llm import call_calendar_api, now_to_minute, FREEBUSY_URL
+from llm_cache import record_usage
+from event_projection import project_events
+
+# Tool-calling chat: the model calls typed Calendar tools directly (several per
+# turn, run in parallel) and answers once it has what it needs, instead of
+# writing a raw REST request for a second call to interpret.
+
+# Model turns per question; the last one must answer without tools
+AGENT_MAX_ROUNDS = int(os.getenv("AGENT_MAX_ROUNDS", "4"))
+AGENT_TOOL_CONCURRENCY = int(os.getenv("AGENT_TOOL_CONCURRENCY", "4"))
+
+LIST_FIELDS = "items(id,summary,start,end,location,description)"
+
+_tool_pool = ThreadPoolExecutor(max_workers=AGENT_TOOL_CONCURRENCY)
+
+
+# ---- Tool schemas ----
+
+class ListEvents(BaseModel):
+    """List events on the user's primary calendar that overlap a time range, in start-time order."""
+    time_min: str = Field(description="Start of the range, RFC 3339 with offset, e.g. 2025-04-07T00:00:00-05:00")
+    time_max: str = Field(description="End of the range, RFC 3339 with offset")
+    query: Optional[str] = Field(None, description="Free-text filter on title, description and location")
+    max_results: int = Field(50, ge=1, le=250)
+
+
+class InsertEvent(BaseModel):
+    """Create an event on the user's primary calendar."""
+    summary: str
+    start: str = Field(description="RFC 3339 date-time with offset, or YYYY-MM-DD for an all-day event")
+    end: str = Field(description="RFC 3339 date-time with offset, or YYYY-MM-DD (exclusive) for an all-day event")
+    description: Optional[str] = None
+    location: Optional[str] = None
+    attendees: Optional[List[str]] = Field(None, description="Attendee email addresses")
+
+
+class PatchEvent(BaseModel):
+    """Change some fields of an existing event. Only the fields given are modified."""
+    event_id: str = Field(description="id of the event, as returned by ListEvents")
+    summary: Optional[str] = None
+    start: Optional[str] = Field(None, description="RFC 3339 date-time with offset, or YYYY-MM-DD")
+    end: Optional[str] = Field(None, description="RFC 3339 date-time with offset, or YYYY-MM-DD")
+    description: Optional[str] = None
+    location: Optional[str] = None
+
+
+class DeleteEvent(BaseModel):
+    """Delete an event from the user's primary calendar."""
+    event_id: str = Field(description="id of the event, as returned by ListEvents")
+
+
+class FreeBusy(BaseModel):
+    """Busy intervals on the user's primary calendar within a time range."""
+    time_min: str = Field(description="RFC 3339 with offset")
+    time_max: str = Field(description="RFC 3339 with offset")
+
+
+# ---- Tool implementations ----
+
+def event_time(value, tz):
+    if len(value) == 10:
+        return {"date": value}
+    return {"dateTime": value, "timeZone": str(tz)}
+
+
+# call_calendar_api returns Google's error body rather than raising; hand it to the model as the tool's result
+def api_error(result):
+    if isinstance(result, dict) and result.get("error"):
+        return {"error": result["error"]}
+    return None
+
+
+def list_events(args, token, tz):
+    params = {
+        "timeMin": args.time_min,
+        "timeMax": args.time_max,
+        "singleEvents": True,
+        "orderBy": "startTime",
+        "maxResults": args.max_results,
+        "timeZone": str(tz),
+        "fields": LIST_FIELDS,
+    }
+    if args.query:
+        params["q"] = args.query
+    result = call_calendar_api({"methods": "GET", "URL": PRIMARY_EVENTS_URL, "params": params}, token)
+    if api_error(result):
+        return api_error(result)
+    # One compact line per event, id first so the model can patch or delete it
+    return {"events": project_events(result.get("items", []), tz, ids=True)}
+
+
+def insert_event(args, token, tz):
+    body = {"summary": args.summary, "start": event_time(args.start, tz), "end": event_time(args.end, tz)}
+    if args.description:
+        body["description"] = args.description
+    if args.location:
+        body["location"] = args.location
+    if args.attendees:
+        body["attendees"] = [{"email": email} for email in args.attendees]
+
+    event = get_service(token).events().insert(calendarId="primary", body=body).execute()
+    write_through(token, event)
+    return {"created": {"id": event["id"], "summary": event.get("summary"), "start": event.get("start"), "end": event.get("end")}}
+
+
+def patch_event_tool(args, token, tz):
+    changes = {}
+    for field in ("summary", "description", "location"):
+        if getattr(args, field) is not None:
+            changes[field] = getattr(args, field)
+    for field in ("start", "end"):
+        if getattr(args, field) is not None:
+            changes[field] = event_time(getattr(args, field), tz)
+
+    store = get_event_store()
+    known = store.get_event(store.user_key(token), args.event_id) if store else None
+    event = patch_event(get_service(token), args.event_id, changes, known=known)
+    if event is not None and event is not known:
+        write_through(token, event)
+    return {"updated": {"id": args.event_id, **changes}}
+
+
+def delete_event(args, token, tz):
+    get_service(token).events().delete(calendarId="primary", eventId=args.event_id).execute()
+    write_through(token, deleted_id=args.event_id)
+    return {"deleted": args.event_id}
+
+
+def free_busy(args, token, tz):
+    body = {"timeMin": args.time_min, "timeMax": args.time_max, "timeZone": str(tz), "items": [{"id": "primary"}]}
+    result = call_calendar_api({"methods": "POST", "URL": FREEBUSY_URL, "params": body}, token)
+    if api_error(result):
+        return api_error(result)
+    calendar = result.get("calendars", {}).get("primary", {})
+    # Per-calendar failures (e.g. notFound) come back inside the calendar entry
+    if calendar.get("errors"):
+        return {"error": calendar["errors"]}
+    return {"busy": calendar.get("busy", [])}
+
+
+TOOLS = {
+    "list_events": (ListEvents, list_events),
+    "insert_event": (InsertEvent, insert_event),
+    "patch_event": (PatchEvent, patch_event_tool),
+    "delete_event": (DeleteEvent, delete_event),
+    "free_busy": (FreeBusy, free_busy),
+}
+
+TOOL_SPECS = [
+    {"type": "function", "function": {"name": name, "description": schema.__doc__, "parameters": schema.model_json_schema()}}
+    for name, (schema, _) in TOOLS.items()
+]
+
+
+# Run one tool call. Bad arguments and API failures go back to the model as
+# the tool's result so it can correct itself within the round cap.
+def run_tool(call, token, tz):
+    if call["name"] not in TOOLS:
+        return {"error": f"Unknown tool {call['name']}"}
+    schema, function = TOOLS[call["name"]]
+    try:
+        return function(schema(**call["args"]), token, tz)
+    except ValidationError as e:
+        return {"error": f"Invalid arguments: {e}"}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+# ---- Agent loop ----
+
+# Identical for every request, so the tool specs and this message form a cacheable prefix
+SYSTEM_PROMPT = (
+    "You are an AI assistant that helps people manage their day-to-day lives by keeping track of "
+    "events in their Google Calendar and modifying it when asked. Use the tools to look up or change "
+    "the calendar, then answer clearly and helpfully in natural language. When several lookups or "
+    "changes are needed, request them together in one turn. Only change events the user asked about."
+)
+
+
+def _setup(question, time_zone):
+    tz = ZoneInfo(time_zone) if time_zone else get_localzone()
+    request_context = f"User's time zone: {tz}\nCurrent time: {now_to_minute(tz).isoformat()}\n\n"
+    return tz, [SystemMessage(SYSTEM_PROMPT), HumanMessage(request_context + question)]
+
+
+def _model(llm, final):
+    # The last round can't call tools, so the loop always ends with an answer
+    return llm.bind_tools(TOOL_SPECS, tool_choice="none" if final else "auto")
+
+
+def final_message(reply):
+    return reply.content or "I couldn't finish that within the allowed number of steps. Please try a more specific request."
+
+
+def _tool_messages(calls, results):
+    return [
+        ToolMessage(content=json.dumps(result, default=str), tool_call_id=call["id"])
+        for call, result in zip(calls, results)
+    ]
+
+
+# Yields ("stage", ...), ("token", ...) and finally ("done", ...) like llm.ask_questions_stream
+def agent_events(llm, question, token, time_zone=None, max_rounds=AGENT_MAX_ROUNDS):
+    tz, messages = _setup(question, time_zone)
+    for round_number in range(max_rounds):
+        reply = None
+        for chunk in _model(llm, round_number == max_rounds - 1).stream(messages):
+            reply = chunk if reply is None else reply + chunk
+            if chunk.content:
+                yield "token", {"text": chunk.content}
+        messages.append(reply)
+        record_usage("agent", reply, count_call=True)
+
+        # The last round always answers, even if the model asked for more tools anyway
+        if not reply.tool_calls or round_number == max_rounds - 1:
+            yield "done", {"message": final_message(reply)}
+            return
+
+        yield "stage", {"stage": "calling calendar", "tools": [call["name"] for call in reply.tool_calls]}
+        results = list(_tool_pool.map(lambda call: run_tool(call, token, tz), reply.tool_calls))
+        messages.extend(_tool_messages(reply.tool_calls, results))
+
+
+def run_agent(llm, question, token, time_zone=None, max_rounds=AGENT_MAX_ROUNDS):
+    for event, payload in agent_events(llm, question, token, time_zone, max_rounds):
+        if event == "done":
+            print(payload["message"])
+            return payload["message"]
+
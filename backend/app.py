@@ -1,25 +1,74 @@
-from flask import Flask, request, jsonify, abort
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-from datetime import datetime, timedelta
+import os
+import json
+import threading
+from flask import Flask, Response, request, abort, stream_with_context
+from datetime import datetime, timedelta, timezone
 from flask_cors import CORS  # Import CORS
-from llm import chat_wrapper, newsletter_wrapper, kanban_wrapper
+from calendar_client import get_service, service_cache_stats
+from event_store import get_event_store, write_through
+from calendar_batch import execute_batch
+from calendar_update import patch_event, EditConflict
+from calendar_fetch import fetch_events, DEFAULT_PAGE_SIZE, DEFAULT_RANGE_DAYS, MAX_PAGE_SIZE
+from response_encoding import encode_json, encode_body, serialize, stats as response_stats
+import events_cache
+import calendar_watch
+import newsletters
+from llm import chat_wrapper, chat_stream_wrapper, newsletter_wrapper, kanban_wrapper, cache_stats, warm_up, valid_time_zone
 
 app = Flask(__name__)
 
 CORS(app)
 
-SCOPES = ["https://www.googleapis.com/auth/calendar"]
-
-def calendar_service():
+_background_started = False
+
+# Background threads, started by the server (`python app.py` below, or the ASGI
+# lifespan in asgi.py) rather than on import, so importing the app starts nothing
+def start_background_threads():
+    global _background_started
+    if _background_started:
+        return
+    _background_started = True
+
+    # LLM/vector clients are created lazily; optionally build them in the background at boot
+    if os.getenv("WARM_UP_CLIENTS") == "1":
+        threading.Thread(target=warm_up, daemon=True).start()
+
+    # Push notifications keep server-side caches fresh instead of polling Google
+    if calendar_watch.enabled():
+        calendar_watch.start_renewal_thread()
+
+    # Newsletters are generated ahead of time and served from storage
+    if newsletters.NEWSLETTER_SCHEDULER:
+        newsletters.start_scheduler()
+
+@app.before_request
+def watch_calendar():
+    auth_header = request.headers.get('Authorization', '')
+    # Not for the notification routes: opening a channel just before sign-out tears it down is wasted work
+    if request.path.startswith("/notifications/"):
+        return
+    if calendar_watch.enabled() and auth_header.startswith('Bearer ') and request.method != "OPTIONS":
+        try:
+            calendar_watch.ensure_channel(auth_header.split(" ")[1])
+        except Exception as e:
+            # Caches still expire on their own; don't fail the request over it
+            print(f"Could not open a watch channel: {e}")
+
+def access_token():
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
         abort(401, description='Missing or invalid Authorization header')
 
-    access_token = auth_header.split(" ")[1]
-    creds = Credentials(token=access_token, scopes=SCOPES)
-    service = build("calendar", "v3", credentials=creds)
-    return service
+    return auth_header.split(" ")[1]
+
+def calendar_service():
+    # Cached per token; the discovery document is parsed once per process
+    return get_service(access_token())
+
+def json_response(payload, status=200):
+    # orjson-encoded, compressed when the client accepts it
+    body, headers = encode_json(payload, request.headers.get("Accept-Encoding"), request.endpoint)
+    return Response(body, status=status, mimetype="application/json", headers=headers)
 
 
 @app.route('/hello')
@@ -29,61 +78,106 @@ def hello():
 
 # ---------------- Google Calendar CRUD ------------------
 
+# Partial responses: only what GET /events returns, and what an edit echoes back
+EVENTS_LIST_FIELDS = "nextPageToken,items(id,summary,start,end,location,description)"
+EVENT_FIELDS = "id,etag,summary,description,location,start,end"
+
+
+def parse_time_arg(name, default):
+    value = request.args.get(name)
+    if not value:
+        return default
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+# Window and paging for GET /events: timeMin/timeMax (RFC 3339, default now -/+ 30 days),
+# pageSize (1-2500) and rangeDays (size of each concurrently fetched slice)
+def events_query_args():
+    now = datetime.now(timezone.utc)
+    time_min = parse_time_arg("timeMin", now - timedelta(days=30))
+    time_max = parse_time_arg("timeMax", now + timedelta(days=30))
+    page_size = int(request.args.get("pageSize", DEFAULT_PAGE_SIZE))
+    range_days = int(request.args.get("rangeDays", DEFAULT_RANGE_DAYS))
+
+    if time_max <= time_min:
+        raise ValueError("'timeMax' must be after 'timeMin'")
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"'pageSize' must be between 1 and {MAX_PAGE_SIZE}")
+    if range_days < 1:
+        raise ValueError("'rangeDays' must be at least 1")
+    return time_min, time_max, page_size, range_days
+
 
+# Polled by the frontend: the last result per user and query is kept for a few
+# seconds, and an unchanged result is answered with 304 via its ETag
 @app.route("/events", methods=["GET"])
 def get_events():
     try:
+        time_min, time_max, page_size, range_days = events_query_args()
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+
+    token = access_token()
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    cached = events_cache.get(token, query)
+    if cached is None:
+        try:
+            body, serialize_ms = serialize(load_events(time_min, time_max, page_size, range_days))
+        except Exception as e:
+            print(f"Error fetching events: {str(e)}")
+            return json_response({"error": str(e)}, 500)
+        cached = events_cache.put(token, query, body)
+    else:
+        serialize_ms = 0.0
+    digest, body = cached
+
+    headers = {"Cache-Control": "private, no-cache"}
+    etag = events_cache.matching_etag(request.headers.get("If-None-Match"), digest)
+    if etag:
+        events_cache.record_not_modified()
+        headers.update(ETag=etag, Vary="Accept-Encoding, Authorization")
+        return Response(status=304, headers=headers)
+
+    body, encoding_headers = encode_body(body, request.headers.get("Accept-Encoding"), request.endpoint, serialize_ms)
+    headers.update(encoding_headers)
+    headers["Vary"] = "Accept-Encoding, Authorization"
+    headers["ETag"] = events_cache.etag_for(digest, encoding_headers.get("Content-Encoding"))
+    return Response(body, status=200, mimetype="application/json", headers=headers)
+
+
+def load_events(time_min, time_max, page_size, range_days):
+    store = get_event_store()
+    if store is not None:
+        # Served from the local store; syncs incrementally once the copy is stale
+        user_key = store.sync(access_token())
+        all_events = store.events_between(user_key, time_min.timestamp(), time_max.timestamp())
+    else:
+        # Fully paginated, fetched as parallel ranges and merged in start-time order
         service = calendar_service()
+        all_events = fetch_events(service, time_min, time_max, page_size=page_size,
+                                  range_days=range_days, fields=EVENTS_LIST_FIELDS)
 
-        now = datetime.utcnow()
-        thirty_days_ago = (now - timedelta(days=30)).isoformat() + "Z"
-        thirty_days_future = (now + timedelta(days=30)).isoformat() + "Z"
-
-        # Get events from the past 30 days
-        past_result = service.events().list(
-            calendarId="primary",
-            timeMin=thirty_days_ago,
-            timeMax=now.isoformat() + "Z",
-            singleEvents=True,
-            orderBy="startTime",
-            maxResults=100,
-        ).execute()
-        past_events = past_result.get("items", [])
-
-        # Get events for the next 30 days
-        upcoming_result = service.events().list(
-            calendarId="primary",
-            timeMin=now.isoformat() + "Z",
-            timeMax=thirty_days_future,
-            singleEvents=True,
-            orderBy="startTime",
-            maxResults=100,
-        ).execute()
-        upcoming_events = upcoming_result.get("items", [])
-
-        # Merge and sort all events by start time
-        all_events = past_events + upcoming_events
-        all_events.sort(key=lambda e: e["start"].get("dateTime", e["start"].get("date")))
-
-        formatted = []
-        for event in all_events:
-            start = event.get("start", {})
-            end = event.get("end", {})
-
-            formatted.append({
-                "summary": event.get("summary", "Untitled Event"),
-                "start": start.get("dateTime", start.get("date")),
-                "end": end.get("dateTime", end.get("date")),
-                "location": event.get("location", ""),
-                "description": event.get("description", ""),
-                "id": event.get("id", "")
-            })
-
-        return jsonify(formatted)
+    formatted = []
+    for event in all_events:
+        start = event.get("start", {})
+        end = event.get("end", {})
+
+        formatted.append({
+            "summary": event.get("summary", "Untitled Event"),
+            "start": start.get("dateTime", start.get("date")),
+            "end": end.get("dateTime", end.get("date")),
+            "location": event.get("location", ""),
+            "description": event.get("description", ""),
+            "id": event.get("id", "")
+        })
+
+    return formatted
+
+# Keep the local event store in step with writes made through these routes
+def store_write(event, deleted_id=None):
+    write_through(access_token(), event, deleted_id)
 
-    except Exception as e:
-        print(f"Error fetching events: {str(e)}")
-        return jsonify({"error": str(e)}), 500
 
 @app.route("/events", methods=["POST"])
 def create_event():
@@ -92,7 +186,7 @@ def create_event():
         data = request.json
 
         if not data.get("summary") or not data.get("start") or not data.get("end"):
-            return jsonify({"error": "Missing required fields: 'summary', 'start', or 'end'."}), 400
+            return json_response({"error": "Missing required fields: 'summary', 'start', or 'end'."}, 400)
 
         event = {
             "summary": data.get("summary"),
@@ -101,26 +195,34 @@ def create_event():
         }
 
         created_event = service.events().insert(calendarId="primary", body=event).execute()
-        return jsonify(created_event), 201
+        store_write(created_event)
+        return json_response(created_event, 201)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
 
 
+# Partial update: only fields that differ from our last-seen copy are sent,
+# guarded by that copy's ETag so a concurrent edit isn't silently overwritten
 @app.route("/events/<event_id>", methods=["PUT"])
 def update_event(event_id):
     try:
         service = calendar_service()
-        data = request.json
-
-        event = service.events().get(calendarId="primary", eventId=event_id).execute()
-        event["summary"] = data.get("summary", event["summary"])
-        event["start"] = data.get("start", event["start"])
-        event["end"] = data.get("end", event["end"])
-
-        updated_event = service.events().update(calendarId="primary", eventId=event_id, body=event).execute()
-        return jsonify(updated_event)
+        data = request.json or {}
+
+        store = get_event_store()
+        known = store.get_event(store.user_key(access_token()), event_id) if store else None
+
+        updated_event = patch_event(service, event_id, data, known=known)
+        if updated_event is None:
+            # Nothing to change and no local copy to return
+            updated_event = service.events().get(calendarId="primary", eventId=event_id, fields=EVENT_FIELDS).execute()
+        elif updated_event is not known:
+            store_write(updated_event)
+        return json_response(updated_event)
+    except EditConflict as e:
+        return json_response({"error": str(e)}, 409)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
 
 
 @app.route("/events/<event_id>", methods=["DELETE"])
@@ -128,15 +230,65 @@ def delete_event(event_id):
     try:
         service = calendar_service()
         service.events().delete(calendarId="primary", eventId=event_id).execute()
-        return jsonify({"message": "Event deleted successfully"}), 200
+        store_write(None, deleted_id=event_id)
+        return json_response({"message": "Event deleted successfully"}, 200)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
+
+
+# Apply many changes in one round trip. Body: {"operations": [{"op": "create"|"patch"|"delete",
+# "id": ..., "body": {...}}, ...]}. Sent to Google as batch requests of up to 50 calls.
+@app.route("/events/batch", methods=["POST"])
+def batch_events():
+    data = request.json or {}
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return json_response({"error": "Missing 'operations' list in request body"}, 400)
+    if not all(isinstance(op, dict) for op in operations):
+        return json_response({"error": "Each operation must be an object"}, 400)
+
+    try:
+        service = calendar_service()
+        results = execute_batch(service, operations)
+
+        for op, result in zip(operations, results):
+            if result["status"] != "ok":
+                continue
+            if op.get("op") == "delete":
+                store_write(None, deleted_id=op["id"])
+            elif result["event"]:
+                store_write(result["event"])
+
+        return json_response({"results": results}, 200)
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
 
 
 @app.route("/current_time", methods=["GET"])
 def current_time():
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    return jsonify({"current_time": now})
+    return json_response({"current_time": now})
+
+
+# ---------------- Push Notifications ------------------
+
+# Called by Google for every change on a watched calendar. Always 200 for
+# channels we opened so Google doesn't retry; anything else is refused.
+@app.route("/notifications/calendar", methods=["POST"])
+def calendar_notification():
+    if not calendar_watch.handle_notification(request.headers):
+        return json_response({"error": "Unknown channel"}, 404)
+    return "", 200
+
+
+# Stop watching the caller's calendar, e.g. on sign-out
+@app.route("/notifications/calendar", methods=["DELETE"])
+def stop_calendar_notifications():
+    try:
+        stopped = calendar_watch.teardown(access_token())
+        return json_response({"stopped": stopped}, 200)
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
 
 
 # ---------------- LLM Integration ------------------
@@ -148,17 +300,52 @@ def ask_llm_question():
         question = data.get("question")
 
         if not question:
-            return jsonify({"error": "Missing 'question' in request body"}), 400
+            return json_response({"error": "Missing 'question' in request body"}, 400)
+        if not valid_time_zone(data.get("timeZone")):
+            return json_response({"error": f"Unknown timeZone {data.get('timeZone')!r}"}, 400)
 
         auth_header = request.headers.get("Authorization")
         if not auth_header or not auth_header.startswith("Bearer "):
             abort(401, description="Missing or invalid Authorization header")
 
         token = auth_header.split(" ")[1]
-        chatResponse = chat_wrapper(question, token)
-        return jsonify({"message": chatResponse}), 200
+        # Optional IANA zone (e.g. "America/Chicago") for resolving "today", "tomorrow", ...
+        chatResponse = chat_wrapper(question, token, data.get("timeZone"))
+        return json_response({"message": chatResponse}, 200)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
+
+
+# Same as /llm/question, but streamed as Server-Sent Events: "stage" events as
+# the pipeline progresses, "token" events with answer text, then "done"
+@app.route("/llm/question/stream", methods=["POST"])
+def stream_llm_question():
+    data = request.json
+    question = data.get("question")
+
+    if not question:
+        return json_response({"error": "Missing 'question' in request body"}, 400)
+    if not valid_time_zone(data.get("timeZone")):
+        return json_response({"error": f"Unknown timeZone {data.get('timeZone')!r}"}, 400)
+
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        abort(401, description="Missing or invalid Authorization header")
+
+    token = auth_header.split(" ")[1]
+
+    def events():
+        try:
+            for event, payload in chat_stream_wrapper(question, token, data.get("timeZone")):
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/llm/newsletter", methods=["GET"])
@@ -170,9 +357,9 @@ def generate_newsletter():
 
         token = auth_header.split(" ")[1]
         newsletter = newsletter_wrapper(token)
-        return jsonify({"newsletter": newsletter}), 200
+        return json_response({"newsletter": newsletter}, 200)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
 
 
 @app.route("/llm/kanban", methods=["GET"])
@@ -184,11 +371,25 @@ def get_kanban_todos():
 
         token = auth_header.split(" ")[1]
         kanban = kanban_wrapper(token)
-        return jsonify({"todos": kanban}), 200
+        return json_response({"todos": kanban}, 200)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
+
+
+# ---------------- Diagnostics ------------------
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    stats = cache_stats()
+    stats["calendar_services"] = service_cache_stats()
+    stats["responses"] = response_stats()
+    stats["events_cache"] = events_cache.stats()
+    stats["calendar_watch"] = calendar_watch.stats()
+    stats["newsletters"] = newsletters.stats()
+    return json_response(stats, 200)
 
 
 # ---------------- Run App ------------------
 if __name__ == "__main__":
+    start_background_threads()
     app.run(debug=True, host='0.0.0.0', port=5001, threaded=True)
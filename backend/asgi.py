@@ -0,0 +1,171 @@
+import os
+import json
+import asyncio
+from asgiref.wsgi import WsgiToAsgi
+import llm_async
+import calendar_watch
+from app import app as flask_app, start_background_threads
+from response_encoding import encode_json
+from llm import valid_time_zone
+
+# ASGI entry point. The LLM endpoints run the same code as the Flask routes in
+# worker threads (llm_async.py) and stream answers without buffering; every
+# other route is served by the Flask app through asgiref's WSGI adapter. Each
+# worker process starts its own background threads from the lifespan startup.
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 5001 --workers 4
+#   python asgi.py
+#
+# Cache invalidation is per process (invalidation.py); with push notifications
+# on, run a single worker or accept that other workers catch up by TTL.
+
+flask_asgi = WsgiToAsgi(flask_app)
+
+# Same policy flask_cors applies to the Flask routes
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        self.body = body
+
+    def json(self):
+        try:
+            return json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Request body must be JSON")
+
+    def token(self):
+        auth_header = self.headers.get("authorization", "")
+        if not auth_header.startswith("Bearer "):
+            raise HTTPError(401, "Missing or invalid Authorization header")
+        return auth_header.split(" ")[1]
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_json(send, request, payload, status=200):
+    body, headers = encode_json(payload, request.headers.get("accept-encoding"), request.scope["path"])
+    raw_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    raw_headers += [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers + CORS_HEADERS})
+    await send({"type": "http.response.body", "body": body})
+
+
+# ---------------- LLM Integration ------------------
+
+async def ask_llm_question(request, send):
+    data = request.json()
+    question = data.get("question")
+    if not question:
+        raise HTTPError(400, "Missing 'question' in request body")
+    if not valid_time_zone(data.get("timeZone")):
+        raise HTTPError(400, f"Unknown timeZone {data.get('timeZone')!r}")
+
+    chatResponse = await llm_async.chat_wrapper(question, request.token(), data.get("timeZone"))
+    await send_json(send, request, {"message": chatResponse})
+
+
+async def stream_llm_question(request, send):
+    data = request.json()
+    question = data.get("question")
+    if not question:
+        raise HTTPError(400, "Missing 'question' in request body")
+    if not valid_time_zone(data.get("timeZone")):
+        raise HTTPError(400, f"Unknown timeZone {data.get('timeZone')!r}")
+    token = request.token()
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ] + CORS_HEADERS,
+    })
+    try:
+        async for event, payload in llm_async.chat_stream_wrapper(question, token, data.get("timeZone")):
+            chunk = f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+    except Exception as e:
+        chunk = f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def generate_newsletter(request, send):
+    newsletter = await llm_async.newsletter_wrapper(request.token())
+    await send_json(send, request, {"newsletter": newsletter})
+
+
+async def get_kanban_todos(request, send):
+    kanban = await llm_async.kanban_wrapper(request.token())
+    await send_json(send, request, {"todos": kanban})
+
+
+# Same as app.watch_calendar, for the routes Flask doesn't see
+async def watch_calendar(request):
+    auth_header = request.headers.get("authorization", "")
+    if calendar_watch.enabled() and auth_header.startswith("Bearer "):
+        try:
+            await asyncio.to_thread(calendar_watch.ensure_channel, auth_header.split(" ")[1])
+        except Exception as e:
+            print(f"Could not open a watch channel: {e}")
+
+
+ROUTES = {
+    ("POST", "/llm/question"): ask_llm_question,
+    ("POST", "/llm/question/stream"): stream_llm_question,
+    ("GET", "/llm/newsletter"): generate_newsletter,
+    ("GET", "/llm/kanban"): get_kanban_todos,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            start_background_threads()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    handler = ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+    if handler is None:
+        return await flask_asgi(scope, receive, send)
+
+    request = Request(scope, await read_body(receive))
+    try:
+        await watch_calendar(request)
+        await handler(request, send)
+    except HTTPError as e:
+        await send_json(send, request, {"error": str(e)}, e.status)
+    except Exception as e:
+        await send_json(send, request, {"error": str(e)}, 500)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi:app", host="0.0.0.0", port=5001, workers=int(os.getenv("WEB_CONCURRENCY", "1")))
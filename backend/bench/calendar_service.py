@@ -0,0 +1,39 @@
+# Micro-benchmark for calendar_service(): the old per-request
+# googleapiclient.discovery.build() versus calendar_client.get_service().
+# Runs offline -- building a service never touches the network.
+#
+#   python bench/calendar_service.py --iterations 200
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from calendar_client import SCOPES, get_service
+
+
+def time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    def build_per_request(i):
+        build("calendar", "v3", credentials=Credentials(token="token", scopes=SCOPES))
+
+    results = {
+        "build() per request (before)": time_per_call(build_per_request, args.iterations),
+        "get_service(), new token each call": time_per_call(lambda i: get_service(f"token-{i}"), args.iterations),
+        "get_service(), same token (after)": time_per_call(lambda i: get_service("token"), args.iterations),
+    }
+    for name, ms in results.items():
+        print(f"{name:<38}{ms:>10.3f} ms/call")
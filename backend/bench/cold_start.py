@@ -0,0 +1,57 @@
+# Cold-start timing report for llm.py.
+#
+# Each measurement runs in a fresh interpreter so module caches don't leak
+# between runs. Run it on two checkouts (e.g. before and after a change) and
+# compare:
+#
+#   python bench/cold_start.py
+#   python bench/cold_start.py --question "what do I have tomorrow"
+#
+# --question additionally times the first and second retrieval after import,
+# which needs working Pinecone/OpenAI credentials in .env.
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import llm
+t1 = time.perf_counter()
+result = {"import_llm_ms": (t1 - t0) * 1000}
+question = sys.argv[1] if len(sys.argv) > 1 else None
+if question:
+    llm.query_pinecone(question)
+    t2 = time.perf_counter()
+    llm.query_pinecone(question + " please")
+    t3 = time.perf_counter()
+    result["first_query_ms"] = (t2 - t1) * 1000
+    result["second_query_ms"] = (t3 - t2) * 1000
+t4 = time.perf_counter()
+import app
+result["import_app_ms"] = (time.perf_counter() - t4) * 1000
+print(json.dumps(result))
+"""
+
+
+def run_probe(question):
+    args = [sys.executable, "-c", PROBE] + ([question] if question else [])
+    output = subprocess.run(args, cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure llm.py import and first-request latency.")
+    parser.add_argument("--question", help="Also time the first retrieval for this question")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [run_probe(args.question) for _ in range(args.runs)]
+    print(f"{'metric':<18}{'min ms':>10}{'median ms':>12}")
+    for metric in runs[0]:
+        values = sorted(run[metric] for run in runs)
+        print(f"{metric:<18}{values[0]:>10.1f}{values[len(values) // 2]:>12.1f}")
@@ -0,0 +1,71 @@
+# Payload size and serialization time for a list of events: full Google event
+# resources encoded with the stdlib json module (what jsonify does) versus the
+# `fields` projection encoded with orjson, with and without compression.
+#
+#   python bench/event_payload.py --events 500
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_store import parse_fields, project_fields
+from response_encoding import encode_json
+
+LIST_FIELDS = "items(id,summary,start,end,location,description)"
+
+
+def full_event(i):
+    return {
+        "kind": "calendar#event",
+        "etag": f'"3{i:015d}"',
+        "id": f"evt{i:08d}",
+        "status": "confirmed",
+        "htmlLink": f"https://www.google.com/calendar/event?eid=evt{i:08d}",
+        "created": "2025-04-01T12:00:00.000Z",
+        "updated": "2025-04-02T12:00:00.000Z",
+        "summary": f"Project sync #{i}",
+        "description": "Weekly check-in on roadmap, blockers and demos. " * 3,
+        "location": "Room 2.105",
+        "creator": {"email": "owner@example.com", "self": True},
+        "organizer": {"email": "owner@example.com", "self": True},
+        "start": {"dateTime": "2025-04-07T10:00:00-05:00", "timeZone": "America/Chicago"},
+        "end": {"dateTime": "2025-04-07T11:00:00-05:00", "timeZone": "America/Chicago"},
+        "iCalUID": f"evt{i:08d}@google.com",
+        "sequence": 0,
+        "attendees": [{"email": f"person{n}@example.com", "responseStatus": "accepted"} for n in range(6)],
+        "hangoutLink": "https://meet.google.com/abc-defg-hij",
+        "conferenceData": {
+            "entryPoints": [{"entryPointType": "video", "uri": "https://meet.google.com/abc-defg-hij", "label": "meet.google.com/abc-defg-hij"}],
+            "conferenceSolution": {"key": {"type": "hangoutsMeet"}, "name": "Google Meet", "iconUri": "https://fonts.gstatic.com/s/i/productlogos/meet_2020q4/v6/web-512dp/logo_meet_2020q4_color_2x_web_512dp.png"},
+            "conferenceId": "abc-defg-hij",
+        },
+        "reminders": {"useDefault": True},
+        "eventType": "default",
+    }
+
+
+def measure(name, fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = fn()
+    ms = (time.perf_counter() - start) / iterations * 1000
+    print(f"{name:<40}{len(result):>10} bytes{ms:>10.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=250)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    full = {"items": [full_event(i) for i in range(args.events)]}
+    projected = project_fields(full, parse_fields(LIST_FIELDS))
+
+    measure("full resources, json (before)", lambda: json.dumps(full).encode("utf-8"), args.iterations)
+    measure("projected, json", lambda: json.dumps(projected).encode("utf-8"), args.iterations)
+    measure("projected, orjson", lambda: encode_json(projected)[0], args.iterations)
+    measure("projected, orjson + gzip", lambda: encode_json(projected, "gzip")[0], args.iterations)
+    measure("projected, orjson + zstd (after)", lambda: encode_json(projected, "zstd")[0], args.iterations)
@@ -0,0 +1,42 @@
+# Prompt tokens for a week of events: the raw Calendar API response dumped as
+# indented JSON (the old prompts) versus the compact event lines from
+# event_projection.py.
+#
+#   python bench/prompt_tokens.py --events 40
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_builder import count_tokens
+from event_projection import compact_response, events_block
+from event_payload import full_event
+
+
+def week_event(i):
+    event = full_event(i)
+    day, hour = 7 + i % 7, 8 + i % 9
+    event["start"] = {"dateTime": f"2025-04-{day:02d}T{hour:02d}:00:00-05:00", "timeZone": "America/Chicago"}
+    event["end"] = {"dateTime": f"2025-04-{day:02d}T{hour + 1:02d}:00:00-05:00", "timeZone": "America/Chicago"}
+    event["description"] = "<p>Weekly check-in on roadmap, blockers and demos.</p><br>" * (1 + i % 8)
+    return event
+
+
+def report(name, text, baseline=None):
+    tokens = count_tokens(text)
+    ratio = f"{baseline / tokens:>8.1f}x" if baseline else ""
+    print(f"{name:<40}{tokens:>10} tokens{ratio}")
+    return tokens
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=40)
+    args = parser.parse_args()
+
+    full = {"items": [week_event(i) for i in range(args.events)]}
+    before = report("full response, indent=4 (before)", json.dumps(full, indent=4))
+    report("interpret prompt lines (after)", compact_response(full), before)
+    report("newsletter/todo lines (after)", events_block(full["items"]), before)
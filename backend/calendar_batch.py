@@ -0,0 +1,77 @@
+import re
+from urllib.parse import unquote
+
+# Google caps a Calendar batch request at 50 calls
+BATCH_LIMIT = 50
+
+EVENT_URL_PATTERN = re.compile(r"/calendars/(?P<calendar>[^/]+)/events(?:/(?P<event>[^/?]+))?/?(?:\?.*)?$")
+
+
+def build_request(service, op):
+    kind = op.get("op")
+    calendar_id = op.get("calendarId", "primary")
+    events = service.events()
+
+    if kind == "create":
+        return events.insert(calendarId=calendar_id, body=op["body"])
+    if kind == "patch":
+        return events.patch(calendarId=calendar_id, eventId=op["id"], body=op["body"])
+    if kind == "update":
+        return events.update(calendarId=calendar_id, eventId=op["id"], body=op["body"])
+    if kind == "delete":
+        return events.delete(calendarId=calendar_id, eventId=op["id"])
+    raise ValueError(f"Unsupported operation {kind!r}")
+
+
+# Run create/patch/update/delete operations as Google batch requests of up to
+# 50 calls each. Returns one result per operation, in order.
+def execute_batch(service, ops):
+    results = [None] * len(ops)
+
+    def on_response(request_id, response, exception):
+        i = int(request_id)
+        if exception is not None:
+            status = getattr(getattr(exception, "resp", None), "status", None)
+            results[i] = {"op": ops[i].get("op"), "status": "error", "code": status, "error": str(exception)}
+        else:
+            results[i] = {"op": ops[i].get("op"), "status": "ok", "event": response or None}
+
+    for start in range(0, len(ops), BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=on_response)
+        for i in range(start, min(start + BATCH_LIMIT, len(ops))):
+            try:
+                batch.add(build_request(service, ops[i]), request_id=str(i))
+            except (KeyError, ValueError) as e:
+                results[i] = {"op": ops[i].get("op"), "status": "error", "code": 400, "error": f"Invalid operation: {e}"}
+        batch.execute()
+
+    return results
+
+
+# Translate LLM-style {methods, URL, params} requests into batch operations
+def ops_from_requests(requests_json):
+    ops = []
+    for request_json in requests_json:
+        method = (request_json.get("methods") or "").upper()
+        match = EVENT_URL_PATTERN.search(request_json.get("URL") or "")
+        if not match:
+            ops.append({"op": None})
+            continue
+
+        op = {"calendarId": unquote(match.group("calendar"))}
+        event_id = match.group("event")
+        if event_id:
+            op["id"] = unquote(event_id)
+
+        if method == "POST" and not event_id:
+            op.update(op="create", body=request_json.get("params") or {})
+        elif method == "PATCH" and event_id:
+            op.update(op="patch", body=request_json.get("params") or {})
+        elif method == "PUT" and event_id:
+            op.update(op="update", body=request_json.get("params") or {})
+        elif method == "DELETE" and event_id:
+            op["op"] = "delete"
+        else:
+            op["op"] = None
+        ops.append(op)
+    return ops
@@ -0,0 +1,84 @@
+import os
+import json
+import hashlib
+import threading
+from cachetools import TTLCache
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import build_http
+
+SCOPES = ["https://www.googleapis.com/auth/calendar"]
+
+# Defaults to the discovery document bundled with google-api-python-client
+CALENDAR_DISCOVERY_PATH = os.getenv("CALENDAR_DISCOVERY_PATH")
+SERVICE_CACHE_SIZE = int(os.getenv("CALENDAR_SERVICE_CACHE_SIZE", "256"))
+# Google access tokens live an hour; don't hold a service much longer than its token
+SERVICE_CACHE_TTL = int(os.getenv("CALENDAR_SERVICE_CACHE_TTL", "3000"))
+
+_discovery_doc = None
+_discovery_lock = threading.Lock()
+
+_services = TTLCache(maxsize=SERVICE_CACHE_SIZE, ttl=SERVICE_CACHE_TTL)
+_services_lock = threading.Lock()
+
+
+# Load and parse the Calendar v3 discovery document once per process
+def discovery_document():
+    global _discovery_doc
+    if _discovery_doc is None:
+        with _discovery_lock:
+            if _discovery_doc is None:
+                if CALENDAR_DISCOVERY_PATH:
+                    with open(CALENDAR_DISCOVERY_PATH, encoding="utf-8") as file:
+                        _discovery_doc = json.load(file)
+                else:
+                    _discovery_doc = json.loads(get_static_doc("calendar", "v3"))
+    return _discovery_doc
+
+
+# httplib2.Http isn't thread-safe, so a cached service can't share one
+# connection between concurrent requests. Each request borrows an idle
+# authorized connection (or opens one) and returns it, keeping it alive.
+# Connections come from build_http(), as in build(), for its socket timeout
+# and 308 handling.
+class PooledHttp:
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def request(self, *args, **kwargs):
+        with self._lock:
+            http = self._idle.pop() if self._idle else None
+        if http is None:
+            http = AuthorizedHttp(self.credentials, http=build_http())
+        try:
+            return http.request(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._idle.append(http)
+
+
+def token_key(access_token):
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+
+# Calendar service for an access token, reused across requests from the same session
+def get_service(access_token):
+    key = token_key(access_token)
+    with _services_lock:
+        service = _services.get(key)
+    if service is not None:
+        return service
+
+    creds = Credentials(token=access_token, scopes=SCOPES)
+    service = build_from_document(discovery_document(), http=PooledHttp(creds))
+    with _services_lock:
+        return _services.setdefault(key, service)
+
+
+def service_cache_stats():
+    with _services_lock:
+        return {"services": len(_services), "max_services": _services.maxsize}
@@ -0,0 +1,79 @@
+import os
+import heapq
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PAGE_SIZE = int(os.getenv("EVENTS_PAGE_SIZE", "250"))
+DEFAULT_RANGE_DAYS = int(os.getenv("EVENTS_RANGE_DAYS", "10"))
+FETCH_CONCURRENCY = int(os.getenv("EVENTS_FETCH_CONCURRENCY", "6"))
+MAX_PAGE_SIZE = 2500
+
+
+def to_rfc3339(moment):
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# Split [time_min, time_max) into consecutive ranges of at most range_days
+def split_window(time_min, time_max, range_days=DEFAULT_RANGE_DAYS):
+    ranges = []
+    start = time_min
+    while start < time_max:
+        end = min(start + timedelta(days=range_days), time_max)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def event_start_key(event):
+    start = event.get("start", {})
+    value = start.get("dateTime") or start.get("date")
+    if not value:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+# Every event in one range, following nextPageToken until the range is exhausted
+def fetch_range(service, start, end, page_size=DEFAULT_PAGE_SIZE, calendar_id="primary", fields=None):
+    events = []
+    page_token = None
+    while True:
+        result = service.events().list(
+            calendarId=calendar_id,
+            timeMin=to_rfc3339(start),
+            timeMax=to_rfc3339(end),
+            singleEvents=True,
+            orderBy="startTime",
+            maxResults=page_size,
+            pageToken=page_token,
+            fields=fields,
+        ).execute()
+        events.extend(result.get("items", []))
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return events
+
+
+# Fetch a window as several ranges in parallel and merge the per-range lists,
+# each already sorted by start time, in one pass. An event spanning a range
+# boundary is returned by both ranges and kept once.
+def fetch_events(service, time_min, time_max, page_size=DEFAULT_PAGE_SIZE,
+                 range_days=DEFAULT_RANGE_DAYS, concurrency=FETCH_CONCURRENCY, fields=None):
+    ranges = split_window(time_min, time_max, range_days)
+    if not ranges:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(ranges))) as pool:
+        streams = list(pool.map(lambda r: fetch_range(service, r[0], r[1], page_size, fields=fields), ranges))
+
+    merged = []
+    seen = set()
+    for event in heapq.merge(*streams, key=event_start_key):
+        event_id = event.get("id")
+        if event_id in seen:
+            continue
+        seen.add(event_id)
+        merged.append(event)
+    return merged
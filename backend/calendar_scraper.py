@@ -1,6 +1,16 @@
+import os
+import json
+import hashlib
+import argparse
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
-import json
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(BASE_DIR, "Calendar Web Scrape JSON")
+MANIFEST_PATH = os.getenv("SCRAPE_MANIFEST_PATH", os.path.join(BASE_DIR, "scrape_manifest.json"))
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "8"))
 
 # List of URLs to scrape
 urls = [
@@ -25,27 +35,126 @@ urls = [
     "https://developers.google.com/calendar/v3/reference/calendars/update"
 ]
 
-# Function to scrape and save content
-def scrape_page(url, index):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+
+# .../reference/events/list -> events_list.json, .../reference/events -> events_overview.json
+def output_filename(url):
+    parts = url.rstrip("/").split("/")
+    if parts[-2] == "reference":
+        return f"{parts[-1]}_overview.json"
+    return f"{parts[-2]}_{parts[-1]}.json"
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def extract_content(html):
+    soup = BeautifulSoup(html, 'html.parser')
 
     # Find the article container where the main content starts
     article = soup.find('article', class_='devsite-article')
 
     # Extract the entire content of the article
     if article:
-        content = article.get_text(separator="\n", strip=True)
-    else:
-        content = "No content found."
+        return article.get_text(separator="\n", strip=True)
+    return "No content found."
+
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def existing_hash(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return content_hash(json.load(file).get("content", ""))
+
+
+# Fetch one page with a conditional GET and rewrite its file only if the article text changed.
+# Returns the updated manifest entry and whether the file was written.
+def scrape_page(session, url, entry, output_dir=OUTPUT_DIR):
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
 
-    # Create a generic filename based on the index
-    filename = f'file{index}.json'
+    filename = output_filename(url)
+    path = os.path.join(output_dir, filename)
+
+    response = session.get(url, headers=headers, timeout=30)
+    if response.status_code == 304 and os.path.exists(path):
+        return entry, False
+    response.raise_for_status()
+
+    content = extract_content(response.content)
+    new_entry = {
+        "file": filename,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_hash": content_hash(content),
+    }
+
+    previous_hash = entry.get("content_hash") or existing_hash(path)
+    if new_entry["content_hash"] == previous_hash and os.path.exists(path):
+        return new_entry, False
 
     # Save content to a JSON file with pretty formatting
-    with open(filename, 'w', encoding='utf-8') as file:
+    with open(path, 'w', encoding='utf-8') as file:
         json.dump({"url": url, "content": content}, file, ensure_ascii=False, indent=4)
+    return new_entry, True
+
+
+# Scrape every page concurrently over one keep-alive connection pool.
+# Returns the paths of the files whose content changed.
+def scrape_all(page_urls=urls, output_dir=OUTPUT_DIR, manifest_path=MANIFEST_PATH, concurrency=SCRAPE_CONCURRENCY):
+    manifest = load_manifest(manifest_path)
+    os.makedirs(output_dir, exist_ok=True)
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+
+    changed = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {url: pool.submit(scrape_page, session, url, manifest.get(url, {}), output_dir) for url in page_urls}
+        for url, future in futures.items():
+            try:
+                entry, was_changed = future.result()
+            except requests.RequestException as e:
+                print(f"Failed to scrape {url}: {e}")
+                continue
+
+            manifest[url] = entry
+            if was_changed:
+                changed.append(os.path.join(output_dir, entry["file"]))
+
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=4)
+    return changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape the Google Calendar API reference docs.")
+    parser.add_argument("--concurrency", type=int, default=SCRAPE_CONCURRENCY)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--ingest", choices=["pinecone", "local"], help="Embed the changed files into this vector index")
+    args = parser.parse_args()
+
+    changed = scrape_all(output_dir=args.output_dir, concurrency=args.concurrency)
+    print(f"{len(changed)} of {len(urls)} pages changed")
+    for path in changed:
+        print(path)
+
+    if args.ingest and changed:
+        from langchain_openai import OpenAIEmbeddings
+        from ingest import ingest, make_target, ManifestMissing
 
-# Loop through the URLs and scrape each one
-for index, url in enumerate(urls, start=1):
-    scrape_page(url, index)
+        embedder = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+        try:
+            ingest(make_target(args.ingest), embedder, paths=changed, docs_dir=args.output_dir)
+        except ManifestMissing as e:
+            parser.error(str(e))
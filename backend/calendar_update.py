@@ -0,0 +1,62 @@
+import os
+from googleapiclient.errors import HttpError
+
+# Fields PUT /events/<id> lets a client change
+UPDATABLE_FIELDS = ("summary", "description", "location", "start", "end")
+# What a conflict refetch needs: the new ETag and the fields we diff against
+REFETCH_FIELDS = "id,etag," + ",".join(UPDATABLE_FIELDS)
+# Refetch-and-retry attempts after a 412 before giving up
+MAX_CONFLICT_RETRIES = int(os.getenv("EVENT_EDIT_RETRIES", "2"))
+
+
+class EditConflict(Exception):
+    pass
+
+
+# Only the requested fields whose value differs from the event as last seen
+def changed_fields(event, changes):
+    diff = {}
+    for field in UPDATABLE_FIELDS:
+        if field in changes and (event is None or event.get(field) != changes[field]):
+            diff[field] = changes[field]
+    return diff
+
+
+def requested_fields(changes):
+    return {field: changes[field] for field in UPDATABLE_FIELDS if field in changes}
+
+
+def _patch(service, event_id, body, etag, calendar_id):
+    req = service.events().patch(calendarId=calendar_id, eventId=event_id, body=body)
+    if etag:
+        # Google rejects the write with 412 if the event changed since we saw it
+        req.headers["If-Match"] = etag
+    return req.execute()
+
+
+# Apply an edit with a single PATCH in the common case. `known` is the event as
+# last seen (e.g. from the event store); its ETag guards against overwriting a
+# concurrent edit. On 412 the event is refetched, re-diffed and patched again.
+def patch_event(service, event_id, changes, known=None, calendar_id="primary",
+                max_retries=MAX_CONFLICT_RETRIES):
+    event = known
+    # Whether `event` was fetched from Google during this call rather than cached
+    fresh = False
+    for attempt in range(max_retries + 1):
+        body = changed_fields(event, changes)
+        if not body:
+            if event is None or fresh or not requested_fields(changes):
+                return event
+            # No difference from a cached copy proves nothing: someone may have
+            # changed these fields since. Send them, guarded by the cached ETag,
+            # so a 412 brings a fresh copy to diff against.
+            body = requested_fields(changes)
+        try:
+            return _patch(service, event_id, body, event and event.get("etag"), calendar_id)
+        except HttpError as e:
+            if e.resp.status != 412:
+                raise
+            print(f"Edit conflict on event {event_id} (attempt {attempt + 1}); refetching")
+            event = service.events().get(calendarId=calendar_id, eventId=event_id, fields=REFETCH_FIELDS).execute()
+            fresh = True
+    raise EditConflict(f"Event {event_id} kept changing; gave up after {max_retries + 1} attempts")
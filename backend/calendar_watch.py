@@ -0,0 +1,211 @@
+import os
+import time
+import uuid
+import secrets
+import sqlite3
+import threading
+from cachetools import TTLCache
+import http_client
+import invalidation
+from calendar_client import token_key
+from event_store import user_key, CALENDAR_API, PRIMARY_EVENTS_URL
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Public HTTPS address of POST /notifications/calendar; push notifications are off when unset
+WATCH_WEBHOOK_URL = os.getenv("WATCH_WEBHOOK_URL")
+WATCH_DB_PATH = os.getenv("WATCH_DB_PATH", os.path.join(BASE_DIR, "watch_channels.sqlite"))
+# Requested channel lifetime (Google caps events.watch channels at about a week)
+WATCH_TTL = int(os.getenv("WATCH_TTL", str(7 * 24 * 3600)))
+# Channels expiring within this many seconds are replaced
+WATCH_RENEW_MARGIN = int(os.getenv("WATCH_RENEW_MARGIN", str(24 * 3600)))
+WATCH_RENEW_INTERVAL = int(os.getenv("WATCH_RENEW_INTERVAL", "600"))
+
+_db = None
+_init_lock = threading.Lock()
+_db_lock = threading.Lock()
+_ensure_lock = threading.Lock()
+# Guards the TTLCaches below; cachetools caches aren't thread-safe
+_cache_lock = threading.Lock()
+
+# Recently seen token per user, for renewing channels in the background. Held
+# in memory only and for less than a token's one-hour lifetime.
+_tokens = TTLCache(maxsize=4096, ttl=3000)
+# Token hashes whose user already has a live channel; skips the check on every request
+_checked = TTLCache(maxsize=4096, ttl=300)
+_counts = {"registered": 0, "renewed": 0, "stopped": 0, "notifications": 0, "rejected": 0}
+
+
+def enabled():
+    return bool(WATCH_WEBHOOK_URL)
+
+
+def db():
+    global _db
+    if _db is None:
+        with _init_lock:
+            if _db is None:
+                conn = sqlite3.connect(WATCH_DB_PATH, check_same_thread=False)
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS channels ("
+                    "  channel_id TEXT PRIMARY KEY, user_key TEXT NOT NULL, resource_id TEXT NOT NULL,"
+                    "  secret TEXT NOT NULL, expiration REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS channels_by_user ON channels (user_key)")
+                conn.commit()
+                _db = conn
+    return _db
+
+
+def _post(token, url, body):
+    response = http_client.request("POST", url, headers={"Authorization": f"Bearer {token}"}, json=body)
+    response.raise_for_status()
+    return response.json() if response.content else {}
+
+
+def add_channel(channel_id, user_key, resource_id, secret, expiration):
+    with _db_lock:
+        db().execute(
+            "INSERT OR REPLACE INTO channels VALUES (?, ?, ?, ?, ?)",
+            (channel_id, user_key, resource_id, secret, expiration),
+        )
+        db().commit()
+
+
+def channels_for(user_key):
+    with _db_lock:
+        return db().execute(
+            "SELECT channel_id, resource_id, expiration FROM channels WHERE user_key = ?", (user_key,)
+        ).fetchall()
+
+
+def get_channel(channel_id):
+    with _db_lock:
+        return db().execute(
+            "SELECT user_key, resource_id, secret FROM channels WHERE channel_id = ?", (channel_id,)
+        ).fetchone()
+
+
+def _forget(channel_id):
+    with _db_lock:
+        db().execute("DELETE FROM channels WHERE channel_id = ?", (channel_id,))
+        db().commit()
+
+
+# Open a new events.watch channel on the user's primary calendar
+def register(token, user):
+    channel_id = str(uuid.uuid4())
+    secret = secrets.token_urlsafe(24)
+    channel = _post(token, f"{PRIMARY_EVENTS_URL}/watch", {
+        "id": channel_id,
+        "type": "web_hook",
+        "address": WATCH_WEBHOOK_URL,
+        "token": secret,
+        "params": {"ttl": str(WATCH_TTL)},
+    })
+    expiration = int(channel.get("expiration", (time.time() + WATCH_TTL) * 1000)) / 1000
+    add_channel(channel_id, user, channel["resourceId"], secret, expiration)
+    _counts["registered"] += 1
+    print(f"Watching calendar of {user} on channel {channel_id} until {time.ctime(expiration)}")
+    return channel_id
+
+
+def stop(token, channel_id, resource_id):
+    try:
+        _post(token, f"{CALENDAR_API}/channels/stop", {"id": channel_id, "resourceId": resource_id})
+    except Exception as e:
+        # Already expired or stopped on Google's side; dropping our record is enough
+        print(f"Stopping channel {channel_id} failed: {e}")
+    _forget(channel_id)
+    _counts["stopped"] += 1
+
+
+# Make sure this user has a channel that isn't about to expire. Called on each
+# authenticated request; cheap once checked.
+def ensure_channel(token):
+    if not enabled():
+        return
+    with _cache_lock:
+        if token_key(token) in _checked:
+            return
+    user = user_key(token)
+    with _cache_lock:
+        _tokens[user] = token
+
+    with _ensure_lock:
+        channels = channels_for(user)
+        live = [c for c in channels if c[2] - time.time() > WATCH_RENEW_MARGIN]
+        if not live:
+            register(token, user)
+            # Replace rather than stack: the new channel is open before the old ones close
+            for channel_id, resource_id, _ in channels:
+                stop(token, channel_id, resource_id)
+            if channels:
+                _counts["renewed"] += 1
+    with _cache_lock:
+        _checked[token_key(token)] = True
+
+
+# Background renewal for users whose token we still hold
+def renew_expiring():
+    with _db_lock:
+        users = [row[0] for row in db().execute(
+            "SELECT DISTINCT user_key FROM channels WHERE expiration - ? < ?", (time.time(), WATCH_RENEW_MARGIN)
+        )]
+    for user in users:
+        with _cache_lock:
+            token = _tokens.get(user)
+            if token is not None:
+                _checked.pop(token_key(token), None)
+        if token is None:
+            continue
+        try:
+            ensure_channel(token)
+        except Exception as e:
+            print(f"Renewing channel for {user} failed: {e}")
+
+
+def start_renewal_thread():
+    def loop():
+        while True:
+            time.sleep(WATCH_RENEW_INTERVAL)
+            renew_expiring()
+
+    threading.Thread(target=loop, daemon=True).start()
+
+
+# Stop every channel for this user (e.g. on sign-out)
+def teardown(token):
+    user = user_key(token)
+    channels = channels_for(user)
+    for channel_id, resource_id, _ in channels:
+        stop(token, channel_id, resource_id)
+    with _cache_lock:
+        _checked.pop(token_key(token), None)
+    return len(channels)
+
+
+# Handle one push notification from its X-Goog-* headers. Returns False if it
+# isn't from a channel we opened.
+def handle_notification(headers):
+    channel = get_channel(headers.get("X-Goog-Channel-ID", ""))
+    if channel is None:
+        _counts["rejected"] += 1
+        return False
+
+    user, resource_id, secret = channel
+    token = headers.get("X-Goog-Channel-Token") or ""
+    if not secrets.compare_digest(token, secret) or headers.get("X-Goog-Resource-ID") != resource_id:
+        _counts["rejected"] += 1
+        return False
+
+    # "sync" only confirms the channel is open
+    if headers.get("X-Goog-Resource-State") != "sync":
+        _counts["notifications"] += 1
+        invalidation.invalidate_user(user, "push")
+    return True
+
+
+def stats():
+    with _db_lock:
+        channels = db().execute("SELECT COUNT(*) FROM channels").fetchone()[0] if enabled() else 0
+    return dict(_counts, enabled=enabled(), channels=channels)
@@ -0,0 +1,88 @@
+import os
+import re
+import tiktoken
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+
+# Page chrome repeated on every scraped developers.google.com page
+BOILERPLATE_LINES = {
+    "Home",
+    "Google Workspace",
+    "Google Calendar",
+    "Reference",
+    "Send feedback",
+    "Stay organized with collections",
+    "Save and categorize content based on your preferences.",
+    "Try it now",
+    "Try it!",
+    "Use the APIs Explorer below to call this method on live data and see the response.",
+}
+
+_encoding = None
+
+
+def get_encoding():
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(text):
+    return len(get_encoding().encode(text))
+
+
+def truncate_tokens(text, max_tokens):
+    encoding = get_encoding()
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+
+def strip_boilerplate(text):
+    lines = [line for line in text.split("\n") if line.strip() not in BOILERPLATE_LINES]
+    return "\n".join(lines).strip()
+
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# Pack the best retrieved passages into the prompt: strip page chrome, skip
+# passages that mostly repeat one already taken, and stop at the token budget.
+# Returns the joined context and its token count.
+def assemble_context(matches, budget=CONTEXT_TOKEN_BUDGET):
+    passages = []
+    kept_shingles = []
+    used = 0
+
+    for match in sorted(matches, key=lambda m: m["score"], reverse=True):
+        text = strip_boilerplate(match["content"])
+        if not text:
+            continue
+
+        shingles = _shingles(text)
+        if any(_similarity(shingles, kept) >= DUPLICATE_THRESHOLD for kept in kept_shingles):
+            continue
+
+        tokens = count_tokens(text)
+        if used + tokens > budget:
+            # Never send an empty context just because the best passage is oversized
+            if passages:
+                continue
+            text = truncate_tokens(text, budget)
+            tokens = budget
+
+        passages.append(text)
+        kept_shingles.append(shingles)
+        used += tokens
+
+    return "\n\n".join(passages), used
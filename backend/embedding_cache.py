@@ -0,0 +1,123 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from cachetools import TTLCache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(BASE_DIR, "embedding_cache.sqlite"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+# The SQLite tier keeps vectors longer than memory, but not forever: rows older
+# than this are ignored and pruned, and only the newest rows up to the cap are kept
+EMBEDDING_DISK_TTL = int(os.getenv("EMBEDDING_DISK_TTL", str(30 * 86400)))
+EMBEDDING_DISK_MAX_ROWS = int(os.getenv("EMBEDDING_DISK_MAX_ROWS", "50000"))
+# Prune after this many inserts rather than on every one
+PRUNE_EVERY = 100
+
+
+# "What's on my calendar today?" and "what's on my calendar today" share an entry
+def normalize_query(text):
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip("?!. ")
+
+
+# Two-tier cache in front of embedder.embed_query: an in-memory LRU with a TTL,
+# backed by a SQLite table of float32 blobs that survives restarts. Vectors
+# for a retired model or text nobody asks about any more age out of the table.
+class EmbeddingCache:
+    def __init__(self, embedder, path=EMBEDDING_CACHE_PATH, maxsize=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL,
+                 disk_ttl=EMBEDDING_DISK_TTL, max_rows=EMBEDDING_DISK_MAX_ROWS):
+        self.embedder = embedder
+        self.model = getattr(embedder, "model", type(embedder).__name__)
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.Lock()
+        self.disk_ttl = disk_ttl
+        self.max_rows = max_rows
+        self.inserts = 0
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_created ON embeddings (created)")
+        self.db.commit()
+        with self.lock:
+            self._prune()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model}\0{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+    def embed_query(self, text):
+        key = self._key(text)
+
+        with self.lock:
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory_hits += 1
+                return vector.tolist()
+
+            row = self.db.execute(
+                "SELECT vector FROM embeddings WHERE key = ? AND created >= ?", (key, time.time() - self.disk_ttl)
+            ).fetchone()
+            if row is not None:
+                vector = np.frombuffer(row[0], dtype=np.float32)
+                self.memory[key] = vector
+                self.disk_hits += 1
+                return vector.tolist()
+
+        # Embed outside the lock so one slow API call doesn't block other lookups
+        started = time.perf_counter()
+        vector = np.asarray(self.embedder.embed_query(text), dtype=np.float32)
+        elapsed = time.perf_counter() - started
+
+        with self.lock:
+            self.misses += 1
+            self.miss_seconds += elapsed
+            self.memory[key] = vector
+            self.db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, created) VALUES (?, ?, ?, ?)",
+                (key, self.model, vector.tobytes(), time.time()),
+            )
+            self.db.commit()
+            self.inserts += 1
+            if self.inserts % PRUNE_EVERY == 0:
+                self._prune()
+
+        return vector.tolist()
+
+    # Drop expired rows, then the oldest rows beyond the cap. Caller holds self.lock.
+    def _prune(self):
+        self.db.execute("DELETE FROM embeddings WHERE created < ?", (time.time() - self.disk_ttl,))
+        self.db.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            "  SELECT key FROM embeddings ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+        self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            avg_miss_seconds = self.miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "model": self.model,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "disk_entries": self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0],
+                "avg_embed_seconds": avg_miss_seconds,
+                "estimated_seconds_saved": hits * avg_miss_seconds,
+            }
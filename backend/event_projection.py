@@ -0,0 +1,190 @@
+import os
+import re
+import json
+from datetime import date, datetime, timedelta
+from context_builder import get_encoding
+
+# Calendar data goes into prompts as one dense line per event instead of
+# indented API JSON: only the fields the model uses, times as short stable
+# strings, descriptions cleaned and cut to a shared token budget.
+#
+#   [evt123] Mon Apr 7 10:00-11:00 | Project sync | @ Room 2.105 | with ana@x.com | Roadmap and demos…
+
+# Tokens for all descriptions in one prompt, shared between the events that have one
+EVENT_DESCRIPTION_BUDGET = int(os.getenv("EVENT_DESCRIPTION_BUDGET", "800"))
+# Per-event bounds on that share
+EVENT_DESCRIPTION_MAX = int(os.getenv("EVENT_DESCRIPTION_MAX", "80"))
+EVENT_DESCRIPTION_MIN = 12
+MAX_ATTENDEES = 5
+
+# Bookkeeping the model never needs, dropped wherever it appears
+DROPPED_KEYS = {
+    "kind", "etag", "htmlLink", "iCalUID", "creator", "organizer", "reminders", "sequence",
+    "created", "updated", "conferenceData", "hangoutLink", "eventType", "nextPageToken", "nextSyncToken",
+}
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+SPACE_PATTERN = re.compile(r"\s+")
+
+# Tomorrow.io weather codes (weatherCodeMax in daily forecasts)
+WEATHER_CODES = {
+    1000: "clear", 1100: "mostly clear", 1101: "partly cloudy", 1102: "mostly cloudy", 1001: "cloudy",
+    2000: "fog", 2100: "light fog", 4000: "drizzle", 4001: "rain", 4200: "light rain", 4201: "heavy rain",
+    5000: "snow", 5001: "flurries", 5100: "light snow", 5101: "heavy snow", 6000: "freezing drizzle",
+    6001: "freezing rain", 6200: "light freezing rain", 6201: "heavy freezing rain", 7000: "ice pellets",
+    7101: "heavy ice pellets", 7102: "light ice pellets", 8000: "thunderstorm",
+}
+
+
+def parse_time(value):
+    value = value or {}
+    if value.get("dateTime"):
+        return datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+    if value.get("date"):
+        return date.fromisoformat(value["date"])
+    return None
+
+
+# "Mon Apr 7" -- no zero padding or year, so the same day always reads the same
+def short_day(moment):
+    return f"{moment:%a %b} {moment.day}"
+
+
+def short_time(moment):
+    if isinstance(moment, datetime):
+        return f"{short_day(moment)} {moment:%H:%M}"
+    return short_day(moment)
+
+
+# "Mon Apr 7 10:00-11:00", "Mon Apr 7 22:00-Tue Apr 8 01:00", "Mon Apr 7 all day", "Mon Apr 7-Wed Apr 9 all day"
+def time_span(event, tz=None):
+    start, end = parse_time(event.get("start")), parse_time(event.get("end"))
+    if start is None:
+        return "no time"
+
+    if isinstance(start, datetime):
+        if tz is not None:
+            start = start.astimezone(tz)
+            end = end.astimezone(tz) if isinstance(end, datetime) else end
+        if not isinstance(end, datetime):
+            return short_time(start)
+        if end.date() == start.date():
+            return f"{short_time(start)}-{end:%H:%M}"
+        return f"{short_time(start)}-{short_time(end)}"
+
+    # All-day events end on the following (exclusive) date
+    last_day = end - timedelta(days=1) if isinstance(end, date) and end > start else start
+    if last_day == start:
+        return f"{short_day(start)} all day"
+    return f"{short_day(start)}-{short_day(last_day)} all day"
+
+
+def clean_text(text):
+    return SPACE_PATTERN.sub(" ", TAG_PATTERN.sub(" ", text or "")).strip()
+
+
+def truncate_description(text, max_tokens):
+    tokens = get_encoding().encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return get_encoding().decode(tokens[:max_tokens]).rstrip() + "…"
+
+
+def attendee_text(attendees):
+    names = []
+    for attendee in attendees[:MAX_ATTENDEES]:
+        name = attendee.get("email") or attendee.get("displayName") or "?"
+        if attendee.get("responseStatus") in ("declined", "tentative"):
+            name += f" ({attendee['responseStatus']})"
+        names.append(name)
+    if len(attendees) > MAX_ATTENDEES:
+        names.append(f"+{len(attendees) - MAX_ATTENDEES} more")
+    return "with " + ", ".join(names)
+
+
+def project_event(event, tz=None, description_tokens=EVENT_DESCRIPTION_MAX, ids=False):
+    parts = [time_span(event, tz), event.get("summary") or "(no title)"]
+    if event.get("status") in ("cancelled", "tentative"):
+        parts.append(event["status"])
+    if event.get("location"):
+        parts.append("@ " + clean_text(event["location"]))
+    if event.get("attendees"):
+        parts.append(attendee_text(event["attendees"]))
+    description = clean_text(event.get("description"))
+    if description and description_tokens > 0:
+        parts.append(truncate_description(description, description_tokens))
+
+    line = " | ".join(parts)
+    return f"[{event['id']}] {line}" if ids and event.get("id") else line
+
+
+# Each event with a description gets an equal share of the budget, within the per-event bounds
+def description_share(events, budget=EVENT_DESCRIPTION_BUDGET):
+    described = sum(1 for event in events if event.get("description"))
+    if not described:
+        return 0
+    return max(EVENT_DESCRIPTION_MIN, min(EVENT_DESCRIPTION_MAX, budget // described))
+
+
+def project_events(events, tz=None, ids=False, budget=EVENT_DESCRIPTION_BUDGET):
+    share = description_share(events, budget)
+    return [project_event(event, tz, share, ids) for event in events]
+
+
+def events_block(events, tz=None, ids=False, budget=EVENT_DESCRIPTION_BUDGET):
+    if not events:
+        return "(no events)"
+    return "\n".join(project_events(events, tz, ids, budget))
+
+
+def is_event(value):
+    return isinstance(value, dict) and "start" in value and ("summary" in value or "id" in value)
+
+
+def _compact(value, tz):
+    if is_event(value):
+        return project_event(value, tz, ids=True)
+    if isinstance(value, dict):
+        return {key: _compact(item, tz) for key, item in value.items() if key not in DROPPED_KEYS}
+    if isinstance(value, list):
+        return [_compact(item, tz) for item in value]
+    return value
+
+
+# Any Calendar API response for the interpretation prompt: event lists become
+# event lines, freeBusy becomes busy intervals, anything else (single events,
+# batch results, errors) is compact JSON with events as lines inside it
+def compact_response(data, tz=None):
+    if isinstance(data, dict) and isinstance(data.get("items"), list):
+        return events_block(data["items"], tz, ids=True)
+    if isinstance(data, dict) and isinstance(data.get("calendars"), dict):
+        lines = []
+        for calendar_id, calendar in data["calendars"].items():
+            for busy in calendar.get("busy", []):
+                span = time_span({"start": {"dateTime": busy["start"]}, "end": {"dateTime": busy["end"]}}, tz)
+                lines.append(f"busy {span}" if calendar_id == "primary" else f"{calendar_id} busy {span}")
+        return "\n".join(lines) or "(no busy times)"
+    return json.dumps(_compact(data, tz), separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+# Tomorrow.io daily forecast as (date, line) pairs, one per day
+def weather_days(data, tz=None):
+    days = []
+    for day in ((data or {}).get("timelines") or {}).get("daily") or []:
+        moment = datetime.fromisoformat(day["time"].replace("Z", "+00:00"))
+        if tz is not None:
+            moment = moment.astimezone(tz)
+        values = day.get("values", {})
+        parts = [short_day(moment)]
+        code = values.get("weatherCodeMax")
+        if code is not None:
+            parts.append(WEATHER_CODES.get(code, f"code {code}"))
+        if values.get("temperatureMin") is not None and values.get("temperatureMax") is not None:
+            parts.append(f"{round(values['temperatureMin'])}-{round(values['temperatureMax'])}°C")
+        if values.get("precipitationProbabilityAvg") is not None:
+            parts.append(f"rain {round(values['precipitationProbabilityAvg'])}%")
+        if values.get("windSpeedAvg") is not None:
+            parts.append(f"wind {round(values['windSpeedAvg'])} m/s")
+        days.append((moment.date(), " | ".join(parts)))
+    return days
+
@@ -0,0 +1,368 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import http_client
+import invalidation
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from cachetools import TTLCache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# "sqlite" serves calendar reads from the local store; "off" always reads from Google
+EVENT_STORE = os.getenv("EVENT_STORE", "sqlite")
+EVENT_STORE_PATH = os.getenv("EVENT_STORE_PATH", os.path.join(BASE_DIR, "event_store.sqlite"))
+# How stale the store may get before a read triggers an incremental sync
+EVENT_STORE_SYNC_INTERVAL = int(os.getenv("EVENT_STORE_SYNC_INTERVAL", "60"))
+
+CALENDAR_API = "https://www.googleapis.com/calendar/v3"
+PRIMARY_EVENTS_URL = f"{CALENDAR_API}/calendars/primary/events"
+
+# Query parameters a store read can answer; anything else (q, showDeleted, ...) goes to Google
+SUPPORTED_LIST_PARAMS = {"timeMin", "timeMax", "singleEvents", "orderBy", "timeZone", "maxResults", "fields"}
+
+# Partial responses: what the store keeps of each event (it answers every local read, so
+# this is a superset of what readers ask for) and what it needs from the calendar itself
+STORE_LIST_FIELDS = (
+    "nextPageToken,nextSyncToken,items(id,status,etag,summary,description,location,start,end,"
+    "recurringEventId,htmlLink,attendees(email,responseStatus),organizer(email))"
+)
+CALENDAR_FIELDS = "id,timeZone"
+
+
+class SyncTokenExpired(Exception):
+    pass
+
+
+def parse_time(value, tz=timezone.utc):
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=tz)
+    return moment.timestamp()
+
+
+# timeMin/timeMax from a request as a timestamp, or None when it isn't an
+# RFC 3339 time with an offset (Google rejects those, so let Google answer)
+def request_time(value):
+    try:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        return None
+    return moment.timestamp()
+
+
+# Parse a partial-response `fields` spec such as "items(id,start(dateTime))" into
+# {"items": {"id": None, "start": {"dateTime": None}}}
+def parse_fields(spec):
+    fields = {}
+    stack = [fields]
+    name = ""
+    for char in spec + ",":
+        if char in ",()":
+            if name.strip():
+                stack[-1][name.strip()] = None
+            if char == "(":
+                stack[-1][name.strip()] = {}
+                stack.append(stack[-1][name.strip()])
+            elif char == ")":
+                stack.pop()
+            name = ""
+        else:
+            name += char
+    return fields
+
+
+# Apply a `fields` spec to a stored response the way Google applies it to a live one
+def project_fields(value, fields):
+    if isinstance(value, list):
+        return [project_fields(item, fields) for item in value]
+    if not isinstance(value, dict) or fields is None:
+        return value
+    return {key: project_fields(value[key], sub) for key, sub in fields.items() if key in value}
+
+
+# All-day events are placed at midnight in the calendar's own zone
+def event_bounds(event, tz):
+    start = event.get("start", {})
+    end = event.get("end", {})
+    start_value = start.get("dateTime") or start.get("date")
+    end_value = end.get("dateTime") or end.get("date") or start_value
+    return parse_time(start_value, tz), parse_time(end_value, tz)
+
+
+# Local per-user copy of each user's primary calendar, kept current with the
+# Calendar API's incremental sync (syncToken). Reads are indexed range queries.
+class EventStore:
+    def __init__(self, path=EVENT_STORE_PATH, sync_interval=EVENT_STORE_SYNC_INTERVAL):
+        self.sync_interval = sync_interval
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.user_locks = {}
+        self.user_keys = TTLCache(maxsize=1024, ttl=3000)
+
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "  user_key TEXT NOT NULL, id TEXT NOT NULL, start_ts REAL NOT NULL, end_ts REAL NOT NULL,"
+                "  etag TEXT, body TEXT NOT NULL, PRIMARY KEY (user_key, id));"
+                "CREATE INDEX IF NOT EXISTS events_by_time ON events (user_key, start_ts, end_ts);"
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                "  user_key TEXT PRIMARY KEY, sync_token TEXT, time_zone TEXT, synced_at REAL NOT NULL DEFAULT 0);"
+            )
+            self.db.commit()
+
+    # ---- Google API ----
+
+    def _get(self, token, url, params=None):
+        response = http_client.get(url, headers={"Authorization": f"Bearer {token}"}, params=params)
+        if response.status_code == 410:
+            raise SyncTokenExpired()
+        response.raise_for_status()
+        return response.json()
+
+    # Access tokens rotate hourly, so users are keyed by their primary calendar id (their email)
+    def user_key(self, token):
+        token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        # cachetools caches aren't thread-safe; the lookup isn't held across the fetch
+        with self.lock:
+            key = self.user_keys.get(token_hash)
+        if key is None:
+            calendar = self._get(token, f"{CALENDAR_API}/calendars/primary", {"fields": CALENDAR_FIELDS})
+            key = calendar["id"]
+            invalidation.remember(token, key)
+            with self.lock:
+                self.user_keys[token_hash] = key
+                self.db.execute(
+                    "INSERT INTO sync_state (user_key, time_zone) VALUES (?, ?) "
+                    "ON CONFLICT (user_key) DO UPDATE SET time_zone = excluded.time_zone",
+                    (key, calendar.get("timeZone", "UTC")),
+                )
+                self.db.commit()
+        return key
+
+    def _user_lock(self, user_key):
+        with self.lock:
+            return self.user_locks.setdefault(user_key, threading.Lock())
+
+    def _state(self, user_key):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT sync_token, time_zone, synced_at FROM sync_state WHERE user_key = ?", (user_key,)
+            ).fetchone()
+        return row or (None, "UTC", 0)
+
+    def _pages(self, token, params):
+        params = dict(params, fields=STORE_LIST_FIELDS)
+        while True:
+            page = self._get(token, PRIMARY_EVENTS_URL, params)
+            yield page
+            if not page.get("nextPageToken"):
+                return
+            params["pageToken"] = page["nextPageToken"]
+
+    # ---- Sync ----
+
+    # Bring the user's copy up to date if it's older than the sync interval. Returns the user key.
+    def sync(self, token, force=False):
+        user_key = self.user_key(token)
+        with self._user_lock(user_key):
+            sync_token, time_zone, synced_at = self._state(user_key)
+            if not force and sync_token and time.time() - synced_at < self.sync_interval:
+                return user_key
+
+            tz = ZoneInfo(time_zone or "UTC")
+            if sync_token:
+                try:
+                    self._incremental_sync(token, user_key, sync_token, tz)
+                    return user_key
+                except SyncTokenExpired:
+                    print(f"Sync token expired for {user_key}; running a full sync")
+            self._full_sync(token, user_key, tz)
+        return user_key
+
+    def _full_sync(self, token, user_key, tz):
+        rows = []
+        next_sync_token = None
+        for page in self._pages(token, {"singleEvents": True, "maxResults": 2500}):
+            rows.extend(self._row(user_key, event, tz) for event in page.get("items", []) if event.get("status") != "cancelled")
+            next_sync_token = page.get("nextSyncToken", next_sync_token)
+
+        # Swap the user's rows in one transaction so readers never see a half-empty calendar
+        with self.lock:
+            self.db.execute("DELETE FROM events WHERE user_key = ?", (user_key,))
+            self.db.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._save_state(user_key, next_sync_token)
+            self.db.commit()
+
+    def _incremental_sync(self, token, user_key, sync_token, tz):
+        upserts = []
+        deletes = []
+        next_sync_token = sync_token
+        for page in self._pages(token, {"syncToken": sync_token, "singleEvents": True, "showDeleted": True}):
+            for event in page.get("items", []):
+                if event.get("status") == "cancelled":
+                    deletes.append((user_key, event["id"]))
+                else:
+                    upserts.append(self._row(user_key, event, tz))
+            next_sync_token = page.get("nextSyncToken", next_sync_token)
+
+        with self.lock:
+            self.db.executemany("DELETE FROM events WHERE user_key = ? AND id = ?", deletes)
+            self.db.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?)", upserts)
+            self._save_state(user_key, next_sync_token)
+            self.db.commit()
+
+    def _save_state(self, user_key, sync_token):
+        self.db.execute(
+            "INSERT INTO sync_state (user_key, sync_token, synced_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_key) DO UPDATE SET sync_token = excluded.sync_token, synced_at = excluded.synced_at",
+            (user_key, sync_token, time.time()),
+        )
+
+    def _row(self, user_key, event, tz):
+        start_ts, end_ts = event_bounds(event, tz)
+        return (user_key, event["id"], start_ts, end_ts, event.get("etag"), json.dumps(event))
+
+    # Force the next read to sync, e.g. after a write the store didn't see
+    def mark_stale(self, user_key):
+        with self.lock:
+            self.db.execute("UPDATE sync_state SET synced_at = 0 WHERE user_key = ?", (user_key,))
+            self.db.commit()
+
+    # ---- Reads and write-through ----
+
+    def events_between(self, user_key, time_min=None, time_max=None, limit=None):
+        query = "SELECT body FROM events WHERE user_key = ?"
+        args = [user_key]
+        if time_max is not None:
+            query += " AND start_ts < ?"
+            args.append(time_max)
+        if time_min is not None:
+            query += " AND end_ts > ?"
+            args.append(time_min)
+        query += " ORDER BY start_ts"
+        if limit:
+            query += " LIMIT ?"
+            args.append(limit)
+
+        with self.lock:
+            rows = self.db.execute(query, args).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_event(self, user_key, event_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT body FROM events WHERE user_key = ? AND id = ?", (user_key, event_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def upsert_event(self, user_key, event):
+        _, time_zone, _ = self._state(user_key)
+        row = self._row(user_key, event, ZoneInfo(time_zone or "UTC"))
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?)", row)
+            self.db.commit()
+
+    def delete_event(self, user_key, event_id):
+        with self.lock:
+            self.db.execute("DELETE FROM events WHERE user_key = ? AND id = ?", (user_key, event_id))
+            self.db.commit()
+
+    def time_zone(self, user_key):
+        return self._state(user_key)[1]
+
+    # Answer a primary-calendar events.list request from the store, or return
+    # None if it uses parameters the store can't honour
+    def read_list_request(self, token, url, params):
+        params = params or {}
+        if url.rstrip("/") != PRIMARY_EVENTS_URL or not set(params) <= SUPPORTED_LIST_PARAMS:
+            return None
+        if str(params.get("singleEvents", "")).lower() != "true":
+            return None
+
+        bounds = {}
+        for name in ("timeMin", "timeMax"):
+            if params.get(name):
+                bounds[name] = request_time(params[name])
+                if bounds[name] is None:
+                    return None
+        time_min, time_max = bounds.get("timeMin"), bounds.get("timeMax")
+
+        user_key = self.sync(token)
+        items = self.events_between(user_key, time_min, time_max, params.get("maxResults"))
+        response = {"kind": "calendar#events", "timeZone": self.time_zone(user_key), "items": items}
+        if params.get("fields"):
+            response = project_fields(response, parse_fields(params["fields"]))
+        return response
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# Shared store, or None when EVENT_STORE=off
+def get_event_store():
+    global _store
+    if EVENT_STORE != "sqlite":
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = EventStore()
+    return _store
+
+
+# Primary calendar ids by token hash, for when the store is off
+_user_keys = TTLCache(maxsize=4096, ttl=3000)
+_user_keys_lock = threading.Lock()
+
+
+# Who a token belongs to: users are keyed by primary calendar id (their email),
+# as in the store, whether or not the store is enabled
+def user_key(token):
+    store = get_event_store()
+    if store is not None:
+        return store.user_key(token)
+
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    with _user_keys_lock:
+        key = _user_keys.get(token_hash)
+    if key is None:
+        response = http_client.get(
+            f"{CALENDAR_API}/calendars/primary",
+            headers={"Authorization": f"Bearer {token}"},
+            params={"fields": "id"},
+        )
+        response.raise_for_status()
+        key = response.json()["id"]
+        with _user_keys_lock:
+            _user_keys[token_hash] = key
+        invalidation.remember(token, key)
+    return key
+
+
+# Apply a write we made to Google to the local copy, and drop everything derived from it
+def write_through(token, event=None, deleted_id=None):
+    invalidation.invalidate_token(token, "write", keep=("event_store",))
+    store = get_event_store()
+    if store is None:
+        return
+    user_key = store.user_key(token)
+    if deleted_id:
+        store.delete_event(user_key, deleted_id)
+    else:
+        store.upsert_event(user_key, event)
+
+
+# A changed calendar (e.g. a push notification) makes the next read sync
+def _invalidate(user_key, token_hashes):
+    if user_key is not None and get_event_store() is not None:
+        get_event_store().mark_stale(user_key)
+
+
+invalidation.register("event_store", _invalidate)
@@ -0,0 +1,75 @@
+import os
+import hashlib
+import threading
+from cachetools import TTLCache
+import invalidation
+from calendar_client import token_key
+
+# How long a polled /events result is reused without going upstream
+EVENTS_CACHE_TTL = int(os.getenv("EVENTS_CACHE_TTL", "30"))
+EVENTS_CACHE_SIZE = int(os.getenv("EVENTS_CACHE_SIZE", "1024"))
+
+# (token hash, query) -> (digest, serialized body)
+_entries = TTLCache(maxsize=EVENTS_CACHE_SIZE, ttl=EVENTS_CACHE_TTL)
+_lock = threading.Lock()
+_counts = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+
+def body_digest(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+# Strong ETag for one representation; compressed bodies get their own tag
+def etag_for(digest, encoding=None):
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+# The If-None-Match tag naming any representation of this body, or None
+def matching_etag(if_none_match, digest):
+    if not if_none_match:
+        return None
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return etag_for(digest)
+        if tag.removeprefix("W/").strip('"').split("-")[0] == digest:
+            return tag.removeprefix("W/")
+    return None
+
+
+def get(token, query):
+    key = (token_key(token), query)
+    with _lock:
+        entry = _entries.get(key)
+        _counts["hits" if entry else "misses"] += 1
+    return entry
+
+
+def put(token, query, body):
+    entry = (body_digest(body), body)
+    with _lock:
+        _entries[(token_key(token), query)] = entry
+    return entry
+
+
+def record_not_modified():
+    with _lock:
+        _counts["not_modified"] += 1
+
+
+# Drop every cached result for these tokens (see invalidation.py)
+def invalidate(user_key, token_hashes):
+    token_hashes = set(token_hashes)
+    with _lock:
+        for key in [key for key in _entries if key[0] in token_hashes]:
+            _entries.pop(key, None)
+        _counts["invalidations"] += 1
+
+
+invalidation.register("events", invalidate)
+
+
+def stats():
+    with _lock:
+        lookups = _counts["hits"] + _counts["misses"]
+        return dict(_counts, entries=len(_entries), hit_rate=round(_counts["hits"] / lookups, 3) if lookups else 0.0)
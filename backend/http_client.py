@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+from collections import deque
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from tenacity import Retrying, retry_if_exception_type, retry_if_result, stop_after_attempt, wait_random_exponential
+
+# Seconds to open a connection / to wait between bytes of the response
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_MAX_ATTEMPTS = int(os.getenv("HTTP_MAX_ATTEMPTS", "4"))
+# Kept-alive connections per host; should cover the number of Flask threads hitting one API
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Safe to resend after the server may already have acted on them
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Samples kept per host for percentiles
+LATENCY_WINDOW = 256
+
+_session = None
+_session_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+# One session for the whole process. requests keeps a separate keep-alive pool
+# per host, so Calendar and weather calls reuse their own TLS connections.
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                # Requests carry different users' tokens; never let cookies leak between them
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                _session = session
+    return _session
+
+
+def _record(host, seconds, error=False, retry=False):
+    with _stats_lock:
+        entry = _stats.setdefault(host, {
+            "requests": 0, "errors": 0, "retries": 0, "total_seconds": 0.0,
+            "samples": deque(maxlen=LATENCY_WINDOW),
+        })
+        entry["requests"] += 1
+        entry["errors"] += int(error)
+        entry["retries"] += int(retry)
+        entry["total_seconds"] += seconds
+        entry["samples"].append(seconds)
+
+
+def _should_retry(method):
+    def check(response):
+        if response.status_code == 429:
+            return True
+        return response.status_code in RETRY_STATUSES and method in IDEMPOTENT_METHODS
+    return check
+
+
+# requests.request with timeouts, pooled connections and retries. 429 and connect
+# failures are retried for any method (nothing reached the server); other 5xx and
+# read timeouts only for idempotent methods. Returns the last response once
+# retries run out, like requests would.
+def request(method, url, **kwargs):
+    method = method.upper()
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    host = urlsplit(url).netloc
+    session = get_session()
+
+    retry_errors = (requests.ConnectionError, requests.Timeout) if method in IDEMPOTENT_METHODS else requests.ConnectTimeout
+    attempts = Retrying(
+        stop=stop_after_attempt(HTTP_MAX_ATTEMPTS),
+        wait=wait_random_exponential(multiplier=0.5, max=8),
+        retry=retry_if_result(_should_retry(method)) | retry_if_exception_type(retry_errors),
+        retry_error_callback=lambda state: state.outcome.result(),
+        reraise=True,
+    )
+
+    def send():
+        retry = attempts.statistics.get("attempt_number", 1) > 1
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException:
+            _record(host, time.perf_counter() - start, error=True, retry=retry)
+            raise
+        _record(host, time.perf_counter() - start, error=response.status_code >= 500, retry=retry)
+        return response
+
+    return attempts(send)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# Per-host request counts and latency, in milliseconds
+def stats():
+    with _stats_lock:
+        snapshot = {host: dict(entry, samples=list(entry["samples"])) for host, entry in _stats.items()}
+
+    result = {}
+    for host, entry in snapshot.items():
+        samples = entry["samples"]
+        result[host] = {
+            "requests": entry["requests"],
+            "errors": entry["errors"],
+            "retries": entry["retries"],
+            "avg_ms": round(entry["total_seconds"] / entry["requests"] * 1000, 2),
+            "p50_ms": round(_percentile(samples, 0.5) * 1000, 2),
+            "p95_ms": round(_percentile(samples, 0.95) * 1000, 2),
+        }
+    return result
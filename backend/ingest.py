@@ -0,0 +1,180 @@
+import os
+import json
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+from local_index import (
+    LocalIndex, DOCS_DIR, LOCAL_INDEX_DIR, BASE_DIR,
+    load_documents, chunk_text, chunk_id, write_index,
+)
+from semantic_cache import bump_corpus_version
+
+load_dotenv()
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+UPSERT_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 1000
+PINECONE_MANIFEST_PATH = os.getenv("PINECONE_MANIFEST_PATH", os.path.join(BASE_DIR, "pinecone_manifest.json"))
+
+
+class ManifestMissing(Exception):
+    pass
+
+
+def batched(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# Pinecone can't cheaply list what it holds, so we track chunk ids per source file locally
+class PineconeTarget:
+    def __init__(self, index, manifest_path=PINECONE_MANIFEST_PATH):
+        self.index = index
+        self.manifest_path = manifest_path
+
+    # Without a manifest we can't tell which vectors are already in the index
+    # (e.g. from before ingest.py existed), so an incremental run would leave
+    # them next to their re-embedded copies
+    def existing(self):
+        if not os.path.exists(self.manifest_path):
+            raise ManifestMissing(
+                f"No manifest at {self.manifest_path}; run `python ingest.py --rebuild` "
+                "to clear the index and embed the corpus from scratch"
+            )
+        with open(self.manifest_path, encoding="utf-8") as file:
+            return {source: set(ids) for source, ids in json.load(file).items()}
+
+    def clear(self):
+        self.index.delete(delete_all=True)
+        with open(self.manifest_path, "w", encoding="utf-8") as file:
+            json.dump({}, file)
+
+    def apply(self, new_chunks, vectors, stale_ids, sources):
+        for batch in batched(list(zip(new_chunks, vectors)), UPSERT_BATCH_SIZE):
+            self.index.upsert(vectors=[
+                {"id": chunk["id"], "values": list(vector), "metadata": chunk["metadata"]}
+                for chunk, vector in batch
+            ])
+        for batch in batched(sorted(stale_ids), DELETE_BATCH_SIZE):
+            self.index.delete(ids=batch)
+
+        manifest = {source: sorted(ids) for source, ids in self.existing().items()}
+        for source, ids in sources.items():
+            if ids:
+                manifest[source] = sorted(ids)
+            else:
+                manifest.pop(source, None)
+        with open(self.manifest_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=4)
+        bump_corpus_version()
+
+
+# The local index is small enough to rewrite whole; only the embeddings are incremental
+class LocalTarget:
+    def __init__(self, index_dir=LOCAL_INDEX_DIR):
+        self.index_dir = index_dir
+        try:
+            self.index = LocalIndex(index_dir)
+        except FileNotFoundError:
+            self.index = None
+
+    def existing(self):
+        sources = {}
+        if self.index is not None:
+            for chunk in self.index.chunks:
+                sources.setdefault(chunk["metadata"]["source"], set()).add(chunk["id"])
+        return sources
+
+    def clear(self):
+        self.index = None
+
+    def apply(self, new_chunks, vectors, stale_ids, sources):
+        chunks = []
+        rows = []
+        if self.index is not None:
+            keep = [i for i, chunk in enumerate(self.index.chunks) if chunk["id"] not in stale_ids]
+            chunks = [self.index.chunks[i] for i in keep]
+            rows = [np.asarray(self.index.vectors[keep])]
+
+        chunks += new_chunks
+        if len(vectors):
+            rows.append(np.asarray(vectors, dtype=np.float32))
+        matrix = np.concatenate(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
+        write_index(matrix, chunks, self.index_dir)
+        self.index = LocalIndex(self.index_dir)
+
+
+# Chunk and hash every document, embed only chunks the target hasn't seen,
+# and drop the vectors of chunks that disappeared. Passing `paths` limits the
+# run to those files (e.g. the ones a scrape just changed).
+def ingest(target, embedder, paths=None, docs_dir=DOCS_DIR, batch_size=EMBED_BATCH_SIZE):
+    existing = target.existing()
+    known_ids = set().union(*existing.values()) if existing else set()
+
+    documents = load_documents(docs_dir, paths)
+    sources = {}
+    new_chunks = []
+    for source, url, content in documents:
+        ids = set()
+        for text in chunk_text(content):
+            cid = chunk_id(source, text)
+            if cid in ids:
+                continue
+            ids.add(cid)
+            if cid not in known_ids:
+                new_chunks.append({"id": cid, "metadata": {"content": text, "source": source, "url": url}})
+        sources[source] = ids
+
+    # A full run also retires sources whose files were deleted
+    if paths is None:
+        for source in existing:
+            sources.setdefault(source, set())
+
+    stale_ids = set()
+    for source, ids in sources.items():
+        stale_ids |= existing.get(source, set()) - ids
+
+    if not new_chunks and not stale_ids:
+        print(f"Index is up to date ({len(documents)} documents checked)")
+        return {"embedded": 0, "deleted": 0}
+
+    vectors = []
+    for batch in batched(new_chunks, batch_size):
+        vectors.extend(embedder.embed_documents([chunk["metadata"]["content"] for chunk in batch]))
+
+    target.apply(new_chunks, vectors, stale_ids, sources)
+
+    embedded_chars = sum(len(chunk["metadata"]["content"]) for chunk in new_chunks)
+    print(f"Embedded {len(new_chunks)} new chunks ({embedded_chars} chars), deleted {len(stale_ids)} stale chunks")
+    return {"embedded": len(new_chunks), "deleted": len(stale_ids)}
+
+
+def make_target(name):
+    if name == "local":
+        return LocalTarget()
+
+    from pinecone import Pinecone
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return PineconeTarget(pc.Index("llm-embeddings"))
+
+
+if __name__ == "__main__":
+    from langchain_openai import OpenAIEmbeddings
+
+    parser = argparse.ArgumentParser(description="Embed the Calendar reference docs into the vector index.")
+    parser.add_argument("files", nargs="*", help="Only ingest these doc files (default: the whole corpus)")
+    parser.add_argument("--target", choices=["pinecone", "local"], default=os.getenv("RETRIEVAL_BACKEND", "pinecone"))
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--rebuild", action="store_true", help="Drop everything in the target and re-embed from scratch")
+    args = parser.parse_args()
+
+    target = make_target(args.target)
+    if args.rebuild:
+        target.clear()
+
+    embedder = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+    try:
+        ingest(target, embedder, paths=args.files or None, batch_size=args.batch_size)
+    except ManifestMissing as e:
+        parser.error(str(e))
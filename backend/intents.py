@@ -0,0 +1,167 @@
+import re
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+EVENTS_URL = "https://www.googleapis.com/calendar/v3/calendars/primary/events"
+# Enough to match a title for delete and to show the user a listing
+LIST_FIELDS = "items(id,summary,start,end,location)"
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+READ_PATTERN = re.compile(
+    r"^(what('?s| is| do i have| have i got| does my)|am i (free|busy|doing)|do i have|"
+    r"show( me)?|list|any(thing)?|is there anything)\b"
+)
+ADD_PATTERN = re.compile(r"^(add|schedule|create|book|put)\s+(?P<text>.+)$")
+DELETE_PATTERN = re.compile(r"^(delete|cancel|remove)\s+(?P<text>.+)$")
+# A single day quickAdd can place an event on; "next week" or "this weekend" are too vague
+DAY_PATTERN = re.compile(r"\b(today|tonight|tomorrow|" + "|".join(WEEKDAYS) + r")\b")
+TIME_PATTERN = re.compile(r"\b(?P<hour>\d{1,2})(:(?P<minute>\d{2}))?\s*(?P<ampm>am|pm)\b|\b(?P<h24>\d{1,2}):(?P<m24>\d{2})\b")
+
+# Words that describe the event rather than name it ("my 3pm meeting")
+FILLER_WORDS = {
+    "my", "the", "a", "an", "event", "events", "meeting", "appointment", "at", "on", "from",
+    "calendar", "today", "tomorrow", "this", "next", "week", "weekend", "tonight", "please",
+} | set(WEEKDAYS)
+
+
+def start_of_day(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# Resolve "today", "tomorrow", "on friday", "this week", ... to a [start, end) range in the user's zone
+def resolve_range(text, now):
+    today = start_of_day(now)
+
+    if re.search(r"\b(today|tonight)\b", text):
+        return today, today + timedelta(days=1)
+    if re.search(r"\btomorrow\b", text):
+        return today + timedelta(days=1), today + timedelta(days=2)
+    if re.search(r"\bnext week\b", text):
+        monday = today + timedelta(days=7 - today.weekday())
+        return monday, monday + timedelta(days=7)
+    if re.search(r"\b(this )?week\b", text) and not re.search(r"\bday of the week\b", text):
+        return today, today + timedelta(days=7 - today.weekday())
+    if re.search(r"\b(this )?weekend\b", text):
+        saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+        if today.weekday() == 6:
+            saturday = today
+        return saturday, start_of_day(saturday + timedelta(days=7 - saturday.weekday()))
+
+    match = re.search(r"\b(next )?(" + "|".join(WEEKDAYS) + r")\b", text)
+    if match:
+        days_ahead = (WEEKDAYS.index(match.group(2)) - today.weekday()) % 7
+        if match.group(1) and days_ahead == 0:
+            days_ahead = 7
+        day = today + timedelta(days=days_ahead)
+        return day, day + timedelta(days=1)
+
+    return None
+
+
+def parse_time(text):
+    if re.search(r"\bnoon\b", text):
+        return 12, 0
+    match = TIME_PATTERN.search(text)
+    if not match:
+        return None
+    if match.group("h24"):
+        return int(match.group("h24")), int(match.group("m24"))
+
+    hour = int(match.group("hour")) % 12
+    if match.group("ampm") == "pm":
+        hour += 12
+    return hour, int(match.group("minute") or 0)
+
+
+def list_request(start, end, tz):
+    return {
+        "methods": "GET",
+        "URL": EVENTS_URL,
+        "params": {
+            "timeMin": start.isoformat(),
+            "timeMax": end.isoformat(),
+            "singleEvents": True,
+            "orderBy": "startTime",
+            "timeZone": str(tz),
+            "fields": LIST_FIELDS,
+        },
+    }
+
+
+def words_of(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def title_words(text):
+    return [w for w in words_of(TIME_PATTERN.sub(" ", text)) if w not in FILLER_WORDS]
+
+
+# Find the single event the user means by "my 3pm meeting" or "the dentist appointment"
+def find_event(events, text, tz):
+    wanted_time = parse_time(text)
+    words = title_words(text)
+
+    candidates = events
+    if wanted_time is not None:
+        candidates = []
+        for event in events:
+            start = event.get("start", {}).get("dateTime")
+            if start:
+                local = datetime.fromisoformat(start).astimezone(tz)
+                if (local.hour, local.minute) == wanted_time:
+                    candidates.append(event)
+
+    # Title words must match whole words of the summary ("art" isn't "Party"): with
+    # a time they narrow the events at that time, never get ignored in favour of them
+    if words:
+        candidates = [e for e in candidates if set(words) <= set(words_of(e.get("summary", "")))]
+
+    return candidates[0] if len(candidates) == 1 else None
+
+
+# Answer common questions without the request-generation LLM call. Returns the
+# Calendar API response data, or None when the question isn't recognized and
+# should go through the LLM instead.
+def run_intent(question, token, tz, call_api):
+    original = re.sub(r"\s+", " ", question.strip()).rstrip("?!. ")
+    text = original.lower()
+    now = datetime.now(tz)
+
+    match = DELETE_PATTERN.match(text)
+    if match:
+        target = match.group("text")
+        day = resolve_range(target, now) or (start_of_day(now), start_of_day(now) + timedelta(days=1))
+        if parse_time(target) is None and not title_words(target):
+            return None
+
+        listing = call_api(list_request(day[0], day[1], tz), token)
+        event = find_event(listing.get("items", []), target, tz)
+        if event is None:
+            return None
+
+        result = call_api({"methods": "DELETE", "URL": f"{EVENTS_URL}/{event['id']}", "params": {}}, token)
+        deleted = {
+            "deleted": True,
+            "event": {"summary": event.get("summary", ""), "start": event.get("start"), "end": event.get("end")},
+        }
+        # Google answers a successful delete with an empty body and a failure with {"error": ...}
+        if isinstance(result, dict) and result.get("error"):
+            deleted.update(deleted=False, error=result["error"])
+        return deleted
+
+    match = ADD_PATTERN.match(text)
+    if match:
+        # quickAdd needs a concrete day or time to place the event; anything vaguer goes to the LLM
+        event_text = re.sub(r"\s+to my calendar$", "", original[match.start("text"):], flags=re.IGNORECASE)
+        if parse_time(event_text.lower()) is None and not DAY_PATTERN.search(event_text.lower()):
+            return None
+        return call_api({"methods": "POST", "URL": f"{EVENTS_URL}/quickAdd?text={quote(event_text)}", "params": {}}, token)
+
+    if READ_PATTERN.match(text):
+        time_range = resolve_range(text, now)
+        if time_range is None:
+            return None
+        return call_api(list_request(time_range[0], time_range[1], tz), token)
+
+    return None
@@ -0,0 +1,66 @@
+import threading
+from cachetools import TTLCache
+from calendar_client import token_key
+
+# Per-user cache invalidation. Caches keyed by access token register a handler
+# here; when a user's calendar changes (a push notification, a write) every
+# handler is called with the user's key and the token hashes seen for them.
+#
+# All of this is in-process memory: it assumes a single server process. With
+# several workers (uvicorn --workers N) a notification reaches one of them and
+# the others keep their copies until the caches' own TTLs expire.
+
+_handlers = {}
+_lock = threading.Lock()
+# token hash -> user key; tokens rotate hourly, so older ones age out
+_token_users = TTLCache(maxsize=4096, ttl=3600)
+_counts = {}
+
+
+def register(name, handler):
+    with _lock:
+        _handlers[name] = handler
+
+
+def remember(token, user_key):
+    with _lock:
+        _token_users[token_key(token)] = user_key
+
+
+def token_hashes(user_key):
+    with _lock:
+        return [token_hash for token_hash, user in _token_users.items() if user == user_key]
+
+
+# Run every registered handler for this user (except those in `keep`); one
+# failing cache doesn't stop the rest
+def invalidate_user(user_key, reason="change", keep=()):
+    _run(user_key, token_hashes(user_key), reason, keep)
+
+
+# Same, starting from a token. If we don't know whose it is yet, only caches
+# keyed by this token are dropped.
+def invalidate_token(token, reason="write", keep=()):
+    token_hash = token_key(token)
+    with _lock:
+        user_key = _token_users.get(token_hash)
+    if user_key is not None:
+        invalidate_user(user_key, reason, keep)
+    else:
+        _run(None, [token_hash], reason, keep)
+
+
+def _run(user_key, hashes, reason, keep):
+    with _lock:
+        handlers = [(name, handler) for name, handler in _handlers.items() if name not in keep]
+        _counts[reason] = _counts.get(reason, 0) + 1
+    for name, handler in handlers:
+        try:
+            handler(user_key, hashes)
+        except Exception as e:
+            print(f"Invalidating {name} for {user_key} failed: {e}")
+
+
+def stats():
+    with _lock:
+        return {"handlers": sorted(_handlers), "invalidations": dict(_counts), "known_tokens": len(_token_users)}
@@ -0,0 +1,120 @@
+import os
+import re
+import math
+from collections import Counter, defaultdict
+from local_index import DOCS_DIR, load_documents, chunk_text, chunk_id
+
+KEYWORD_CONFIDENCE_RATIO = float(os.getenv("KEYWORD_CONFIDENCE_RATIO", "1.5"))
+KEYWORD_MIN_SCORE = float(os.getenv("KEYWORD_MIN_SCORE", "3.0"))
+RRF_K = 60
+
+# The method half of a doc's file name (quickAdd in events_quickAdd.json) counts this
+# many times, like a title field. The resource half is in nearly every question.
+TITLE_BOOST = 3
+RESOURCE_WORDS = {"events", "calendars", "overview"}
+
+STOPWORDS = {
+    "a", "an", "the", "my", "me", "i", "to", "of", "on", "in", "at", "for", "is", "am", "are",
+    "do", "does", "can", "you", "please", "and", "or", "it", "this", "that", "with", "be",
+    "s", "calendar", "what", "when", "how", "which", "who", "where", "have", "any", "show",
+}
+
+# Everyday phrasing -> the Calendar endpoint vocabulary used in the reference docs
+SYNONYMS = {
+    "remove": ["delete"], "cancel": ["delete"], "clear": ["delete"],
+    "reschedule": ["patch"], "change": ["patch"], "edit": ["patch"], "rename": ["patch"],
+    "postpone": ["patch"], "push": ["patch"], "move": ["patch"],
+    "add": ["insert", "quickadd"], "create": ["insert"], "schedule": ["insert"], "book": ["insert"],
+    "what": ["list"], "show": ["list"], "upcoming": ["list"], "free": ["list"], "busy": ["list"],
+    "when": ["list"], "today": ["list"], "tomorrow": ["list"], "week": ["list"],
+}
+
+
+def tokenize(text):
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+
+# Synonyms are looked up before stopword removal so "what" and "show" still map to list
+def expand_query(query):
+    expanded = tokenize(query)
+    for word in re.findall(r"[a-z0-9]+", query.lower()):
+        expanded.extend(SYNONYMS.get(word, []))
+    return expanded
+
+
+# In-memory inverted index with Okapi BM25 scoring over the same chunks
+# (and chunk ids) that ingest.py embeds into the vector index.
+class KeywordIndex:
+    def __init__(self, chunks, k1=1.2, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+
+        for i, chunk in enumerate(chunks):
+            title = os.path.splitext(chunk["source"])[0].replace("_", " ")
+            title_terms = [term for term in tokenize(title) if term not in RESOURCE_WORDS] * TITLE_BOOST
+            terms = tokenize(chunk["content"]) + title_terms
+            self.doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[term].append((i, tf))
+
+        n = len(chunks)
+        self.avg_length = sum(self.doc_lengths) / n if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    @classmethod
+    def from_documents(cls, docs_dir=DOCS_DIR):
+        chunks = []
+        for source, url, content in load_documents(docs_dir):
+            for text in chunk_text(content):
+                chunks.append({"id": chunk_id(source, text), "content": text, "source": source})
+        return cls(chunks)
+
+    def search(self, query, top_k=5):
+        scores = defaultdict(float)
+        for term in expand_query(query):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / self.avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [
+            {
+                "id": self.chunks[i]["id"],
+                "score": score,
+                "content": self.chunks[i]["content"],
+                "source": self.chunks[i]["source"],
+            }
+            for i, score in ranked
+        ]
+
+
+# The keyword hits are trusted on their own when one doc clearly wins: its best
+# chunk outscores the best chunk of any other doc by KEYWORD_CONFIDENCE_RATIO.
+def is_confident(matches):
+    best_by_source = {}
+    for match in matches:
+        best_by_source.setdefault(match["source"], match["score"])
+
+    scores = sorted(best_by_source.values(), reverse=True)
+    if not scores or scores[0] < KEYWORD_MIN_SCORE:
+        return False
+    return len(scores) == 1 or scores[0] >= KEYWORD_CONFIDENCE_RATIO * scores[1]
+
+
+# Merge ranked match lists by reciprocal rank fusion; the fused score replaces the raw scores
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    fused = {}
+    for ranking in rankings:
+        for rank, match in enumerate(ranking):
+            entry = fused.setdefault(match["id"], {"id": match["id"], "score": 0.0, "content": match["content"]})
+            entry["score"] += 1.0 / (k + rank + 1)
+    return sorted(fused.values(), key=lambda m: m["score"], reverse=True)
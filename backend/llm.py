@@ -1,39 +1,199 @@
 import os
 import json
-from pinecone import Pinecone
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import re
-import requests
+import http_client
+import invalidation
+from llm_cache import invoke_llm, record_usage, stats as llm_cache_stats
+from local_index import LocalIndex, LOCAL_INDEX_DIR
+from embedding_cache import EmbeddingCache
+from semantic_cache import SemanticCache, corpus_version
+from context_builder import assemble_context, count_tokens
+from keyword_index import KeywordIndex, is_confident, reciprocal_rank_fusion
+from event_store import get_event_store, CALENDAR_API, PRIMARY_EVENTS_URL
+from calendar_client import get_service, token_key
+from cachetools import TTLCache
+from calendar_batch import execute_batch, ops_from_requests
+from event_projection import compact_response, events_block
+import todo_cache
+import calendar_watch
 
 load_dotenv()
 
-# Initialize and Connect to Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index_name = "llm-embeddings"
-index = pc.Index(index_name)
+# "pinecone" queries the hosted index; "local" searches the prebuilt in-process index
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "pinecone")
+# Fuse BM25 keyword hits with the vector search, and skip embedding when keywords are decisive
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+
+# Clients are built on first use (not at import) and shared by every request thread
+_clients = {}
+_clients_lock = threading.RLock()
+
+def _get_client(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+    return client
+
+# Initialize and Connect to the vector index
+def _create_index():
+    if RETRIEVAL_BACKEND == "local":
+        return LocalIndex(LOCAL_INDEX_DIR)
+
+    from pinecone import Pinecone
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    index_name = "llm-embeddings"
+    return pc.Index(index_name)
 
 # Initialize LLM and Embeddings
-llm = ChatOpenAI(
-    openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
-    openai_api_base=os.getenv("DEEPSEEK_API_BASE"),
-    model="deepseek-chat"
-)
-
-# llm = ChatOpenAI(
-#    openai_api_key=os.getenv("OPENAI_API_KEY"),
-#    model="gpt-4-turbo"
-# )
-embedder = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
-
-# Query Pinecone for relevant information
+def _create_llm():
+    from langchain_openai import ChatOpenAI
+
+    # return ChatOpenAI(
+    #    openai_api_key=os.getenv("OPENAI_API_KEY"),
+    #    model="gpt-4-turbo"
+    # )
+    return ChatOpenAI(
+        openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
+        openai_api_base=os.getenv("DEEPSEEK_API_BASE"),
+        model="deepseek-chat",
+        # Report token usage on streamed replies too (for llm_cache stats)
+        stream_usage=True
+    )
+
+def _create_embedder():
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+
+# The local index is reopened when the corpus is re-ingested, like the keyword
+# index below, so both halves of hybrid retrieval search the same corpus
+local_index_version = None
+
+def get_index():
+    global local_index_version
+    if RETRIEVAL_BACKEND == "local":
+        version = corpus_version()
+        with _clients_lock:
+            if version != local_index_version:
+                _clients.pop("index", None)
+                local_index_version = version
+    return _get_client("index", _create_index)
+
+def get_llm():
+    return _get_client("llm", _create_llm)
+
+def get_embedder():
+    return _get_client("embedder", _create_embedder)
+
+def get_query_embedder():
+    return _get_client("query_embedder", lambda: EmbeddingCache(get_embedder()))
+
+# Optional startup hook: build every client up front so the first request doesn't pay for it
+def warm_up():
+    get_llm()
+    get_query_embedder()
+    get_index()
+    get_keyword_index()
+
+retrieval_cache = SemanticCache()
+
+# BM25 index over the same doc chunks, rebuilt whenever the corpus is re-ingested
+keyword_index = None
+keyword_index_version = None
+retrieval_counts = {"keyword_only": 0, "hybrid": 0, "vector_only": 0}
+
+def get_keyword_index():
+    global keyword_index, keyword_index_version
+    version = corpus_version()
+    if keyword_index is None or version != keyword_index_version:
+        keyword_index = KeywordIndex.from_documents()
+        keyword_index_version = version
+    return keyword_index
+
+# Query the vector index (Pinecone or local) for relevant information. A
+# decisive keyword match is returned as-is without embedding the question.
+def retrieve_matches(query, top_k=5):
+    keyword_matches = []
+    if HYBRID_RETRIEVAL:
+        keyword_matches = get_keyword_index().search(query, top_k)
+        if is_confident(keyword_matches):
+            retrieval_counts["keyword_only"] += 1
+            return keyword_matches
+
+    query_embedding = get_query_embedder().embed_query(query)
+
+    # Paraphrases of a recent question reuse its results and skip the vector search
+    version = corpus_version()
+    cached = retrieval_cache.lookup(query_embedding, version)
+    if cached is not None:
+        return cached
+
+    results = get_index().query(vector=query_embedding, top_k=top_k, include_metadata=True)
+    matches = [
+        {"id": match["id"], "score": match["score"], "content": match["metadata"]["content"]}
+        for match in results["matches"]
+    ]
+    if keyword_matches:
+        matches = reciprocal_rank_fusion(matches, keyword_matches)[:top_k]
+        retrieval_counts["hybrid"] += 1
+    else:
+        retrieval_counts["vector_only"] += 1
+    retrieval_cache.add(query_embedding, matches, version)
+    return matches
+
 def query_pinecone(query):
-    query_embedding = embedder.embed_query(query)
-    results = index.query(vector=query_embedding, top_k=5, include_metadata=True)
-    
-    retrieved_texts = [match["metadata"]["content"] for match in results["matches"]]
+    retrieved_texts = [match["content"] for match in retrieve_matches(query)]
     return "\n\n".join(retrieved_texts)
 
+# Generated kanban boards per token, dropped when the user's calendar changes
+# (see invalidation.py) or after RESULT_CACHE_TTL seconds. Only push
+# notifications report edits made in Google Calendar itself, so without them
+# (calendar_watch.enabled()) boards are kept for a minute rather than half an
+# hour. Newsletters are stored per day instead (newsletters.py).
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "1800" if calendar_watch.enabled() else "60"))
+result_caches = {
+    "kanban": TTLCache(maxsize=256, ttl=RESULT_CACHE_TTL),
+}
+_results_lock = threading.Lock()
+
+# produce() returns (value, complete); a value missing parts is served but not cached
+def cached_result(kind, token, produce):
+    key = token_key(token)
+    with _results_lock:
+        value = result_caches[kind].get(key)
+    if value is None:
+        value, complete = produce()
+        if value is not None and complete:
+            with _results_lock:
+                result_caches[kind][key] = value
+    return value
+
+def _invalidate_results(user_key, token_hashes):
+    with _results_lock:
+        for cache in result_caches.values():
+            for token_hash in token_hashes:
+                cache.pop(token_hash, None)
+
+invalidation.register("llm_results", _invalidate_results)
+
+def cache_stats():
+    return {
+        "embedding_cache": _clients["query_embedder"].stats() if "query_embedder" in _clients else None,
+        "retrieval_cache": retrieval_cache.stats(),
+        "retrieval_paths": dict(retrieval_counts),
+        "http": http_client.stats(),
+        "results": {kind: len(cache) for kind, cache in result_caches.items()},
+        "llm": llm_cache_stats(),
+        "invalidation": invalidation.stats(),
+        "todos": todo_cache.stats(),
+    }
+
 def format_response(response):
     response_text = response.get('text', '') if hasattr(response, 'get') else str(response)
 
@@ -78,10 +238,35 @@ def format_response(response):
 
 from datetime import datetime, timedelta
 from tzlocal import get_localzone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from intents import run_intent
+
+# Recognize common read and simple write questions without the request-generation LLM call
+INTENT_FAST_PATH = os.getenv("INTENT_FAST_PATH", "1") == "1"
+# "pipeline" uses the generate-request-then-interpret flow below, with the intent
+# fast path, hybrid doc retrieval and batch requests; "agent" answers chat with
+# native tool calling (agent.py), which has none of those and always makes at
+# least two model calls per calendar question
+CHAT_MODE = os.getenv("CHAT_MODE", "pipeline")
+
+# Prompts carry times to the minute, so identical questions within a minute
+# produce byte-identical prompts (see llm_cache.py)
+def now_to_minute(tz):
+    return datetime.now(tz).replace(second=0, microsecond=0)
+
+# Optional IANA zone sent by the client (e.g. "America/Chicago")
+def valid_time_zone(name):
+    if name is None:
+        return True
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return False
 
-def get_week_range_local():
-    tz = get_localzone()
-    now = datetime.now(tz)
+def get_week_range_local(tz=None):
+    tz = tz or get_localzone()
+    now = now_to_minute(tz)
 
     # Calculate days until Sunday (weekday() returns 0 for Monday, 6 for Sunday)
     days_until_sunday = 6 - now.weekday()
@@ -89,20 +274,59 @@ def get_week_range_local():
 
     return now.isoformat(), end_of_week.isoformat(), str(tz)
 
+# Partial response for LLM-generated event reads that go to Google
+EVENT_FIELDS = "id,summary,description,location,start,end,status,attendees(email,responseStatus)"
+EVENT_LIST_FIELDS = f"nextPageToken,items({EVENT_FIELDS})"
+FREEBUSY_URL = f"{CALENDAR_API}/freeBusy"
+EVENTS_URL_PATTERN = re.compile(r"/calendars/[^/]+/events(/[^/?]+)?/?$")
+
+
 def call_calendar_api(request_json, token):
+    # Several changes at once go to Google as a single batch request
+    if isinstance(request_json.get("batch"), list):
+        return call_calendar_batch(request_json["batch"], token)
+
     method = request_json.get("methods")
     url = request_json.get("URL")
     params = request_json.get("params")
 
+    # Event list reads are answered from the local store, kept current by incremental sync
+    store = get_event_store()
+    if store is not None and method.upper() == "GET":
+        stored = store.read_list_request(token, url, params)
+        if stored is not None:
+            return stored
+
+    response = http_client.request(method, url, **calendar_request_args(method, url, params, token))
+    after_calendar_call(method, url, token)
+    return parse_api_response(response)
+
+
+# Keyword arguments for sending an LLM-generated request to Google
+def calendar_request_args(method, url, params, token):
     headers = {
         "Authorization": f"Bearer {token}"
     }
 
+    match = EVENTS_URL_PATTERN.search(url)
+    if method.upper() == "GET" and match and not (params or {}).get("fields"):
+        params = dict(params or {}, fields=EVENT_FIELDS if match.group(1) else EVENT_LIST_FIELDS)
+
     if method.upper() in ["POST", "PATCH"]:
-        response = requests.request(method, url, headers=headers, json=params)
-    else:
-        response = requests.request(method, url, headers=headers, params=params)
+        return {"headers": headers, "json": params}
+    return {"headers": headers, "params": params}
+
 
+# The store didn't see this write; have the next read pick it up. (freeBusy is a POST but only reads.)
+def after_calendar_call(method, url, token):
+    if method.upper() != "GET" and url.startswith(CALENDAR_API) and not url.startswith(FREEBUSY_URL):
+        store = get_event_store()
+        if store is not None:
+            store.mark_stale(store.user_key(token))
+        invalidation.invalidate_token(token, "write", keep=("event_store",))
+
+
+def parse_api_response(response):
     try:
         return response.json()
     except Exception as e:
@@ -110,36 +334,73 @@ def call_calendar_api(request_json, token):
         return {}
 
 
-# Ask questions using data from Pinecone
-def ask_questions(llm, question, token=None):
-    start_time, end_time, user_timezone = get_week_range_local()
-    current_time = datetime.now(get_localzone()).isoformat()
+def call_calendar_batch(requests_json, token):
+    results = execute_batch(get_service(token), ops_from_requests(requests_json))
+
+    store = get_event_store()
+    if store is not None:
+        store.mark_stale(store.user_key(token))
+    invalidation.invalidate_token(token, "write", keep=("event_store",))
+    return {"results": results}
+
 
-    # Define the context for the LLM
+def request_prompt(question, matches, user_timezone, current_time, start_time, end_time):
+    # Static instructions first, then retrieved docs, then per-request values, so
+    # consecutive prompts share the longest possible prefix for provider-side caching
     context = (
         "You are an AI assistant designed to help people manage their day-to-day lives "
         "by keeping track of events in their calendar as well as modifying their calendar "
         "when asked. Your goal is to optimize the user's calendar and ensure it runs as efficiently "
         "as possible. You are tasked with answering questions regarding events and calendar management.\n\n"
-        "Important context:\n"
-        f"- The user's current time zone is: {user_timezone}\n"
-        f"- Current system time is: {current_time}\n"
-        f"- This week's time range is from {start_time} to {end_time}\n\n"
         "For each request, please provide the following information in your response:\n"
         "1. **formatted API request**: Only return a JSON object with keys: `methods`, `URL`, and `params`.\n"
         "Do not include any extra comments or explanations. Just provide the raw output as per the format below:\n"
         "REQUEST: <write the JSON object with keys method, URL, and params here>\n"
+        "If the user asks for several changes at once (e.g. moving all of Tuesday's meetings), return one JSON object "
+        "of the form {\"batch\": [<request>, ...]} where each request has the keys `methods`, `URL`, and `params`.\n"
         "\n\n"
     )
 
-    relevant_data = query_pinecone(question)
-    prompt = f"{context}\n\n{relevant_data}\n\nQuestion: {question}"
-    response = llm.invoke(prompt)
+    relevant_data, context_tokens = assemble_context(matches)
+    request_context = (
+        "Important context:\n"
+        f"- The user's current time zone is: {user_timezone}\n"
+        f"- Current system time is: {current_time}\n"
+        f"- This week's time range is from {start_time} to {end_time}\n\n"
+    )
+    prompt = f"{context}\n\n{relevant_data}\n\n{request_context}Question: {question}"
+    print(f"Request prompt: {count_tokens(prompt)} tokens ({context_tokens} from retrieved docs)")
+    return prompt
 
-    # print(f"\nQuestion: {question}\n")
-    api_request_json = format_response(response)
 
-    api_response_data = call_calendar_api(api_request_json, token)
+def generate_api_request(llm, question, user_timezone, current_time, start_time, end_time):
+    matches = retrieve_matches(question, top_k=8)
+    response = invoke_llm(llm, request_prompt(question, matches, user_timezone, current_time, start_time, end_time), "request")
+
+    # print(f"\nQuestion: {question}\n")
+    return format_response(response)
+
+
+# Everything up to the final answer: yields ("stage", name) as it goes and
+# finally ("prompt", interpret_prompt) for the answering call
+def _ask_pipeline(llm, question, token=None, time_zone=None):
+    tz = ZoneInfo(time_zone) if time_zone else get_localzone()
+    start_time, end_time, user_timezone = get_week_range_local(tz)
+    current_time = now_to_minute(tz).isoformat()
+
+    # Common questions map straight to a Calendar request, leaving only the interpretation call
+    api_response_data = None
+    if INTENT_FAST_PATH:
+        yield "stage", "calling calendar"
+        api_response_data = run_intent(question, token, tz, call_calendar_api)
+
+    if api_response_data is None:
+        yield "stage", "retrieving"
+        api_request_json = generate_api_request(llm, question, user_timezone, current_time, start_time, end_time)
+        yield "stage", "calling calendar"
+        api_response_data = call_calendar_api(api_request_json, token)
+    else:
+        print("Intent fast path: skipped request generation")
 
 #    for question in questions:
 #        relevant_data = query_pinecone(question)
@@ -150,24 +411,61 @@ def ask_questions(llm, question, token=None):
 #        print(f"\nQuestion: {question}\n")
 #        formatted_response = format_response(response)
 
-    # Prompt the LLM to interpret the response using the original question
-    interpret_prompt = (
-        "You have received the following JSON data from the Google Calendar API "
-        "in response to the request you just generated. Based on this data and the user's original question, "
+    yield "stage", "answering"
+    yield "prompt", interpret_prompt(question, api_response_data, user_timezone, current_time, tz)
+
+
+# Prompt the LLM to interpret the response using the original question. Events
+# are given as compact lines (event_projection.py), not the raw API JSON.
+def interpret_prompt(question, api_response_data, user_timezone, current_time, tz=None):
+    return (
+        "You have received the following data from the Google Calendar API "
+        "in response to the request you just generated. Events are listed one per line as "
+        "[id] time | title | details. Based on this data and the user's original question, "
         "provide a clear and helpful natural language response.\n\n"
+        f"API Response:\n{compact_response(api_response_data, tz)}\n\n"
         f"User's Time Zone: {user_timezone}\n"
         f"Current Time: {current_time}\n"
-        f"User's Question: {question}\n\n"
-        f"API Response JSON: {json.dumps(api_response_data, indent=4)}"
+        f"User's Question: {question}"
     )
 
-    final_response = llm.invoke(interpret_prompt)
+
+# Ask questions using data from Pinecone
+def ask_questions(llm, question, token=None, time_zone=None):
+    for kind, value in _ask_pipeline(llm, question, token, time_zone):
+        if kind == "prompt":
+            answer_prompt = value
+
+    final_response = invoke_llm(llm, answer_prompt, "interpret")
     result = final_response.content if hasattr(final_response, 'content') else final_response
 
     print(result)
     return result
 
 
+# Streaming variant of ask_questions: yields (event, payload) pairs -- "stage"
+# as each step starts, "token" as answer text arrives, then "done"
+def ask_questions_stream(llm, question, token=None, time_zone=None):
+    for kind, value in _ask_pipeline(llm, question, token, time_zone):
+        if kind == "stage":
+            yield "stage", {"stage": value}
+        else:
+            answer_prompt = value
+
+    parts = []
+    reply = None
+    for chunk in llm.stream(answer_prompt):
+        reply = chunk if reply is None else reply + chunk
+        text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+        if text:
+            parts.append(text)
+            yield "token", {"text": text}
+    if reply is not None:
+        record_usage("interpret_stream", reply, count_call=True)
+
+    yield "done", {"message": "".join(parts)}
+
+
 # Sample questions
 # questions = [
 #     "What day of the week am I most free?",
@@ -175,76 +473,73 @@ def ask_questions(llm, question, token=None):
 
 # ask_questions(llm, questions)
 
-def chat_wrapper(userPrompt, token):
+def chat_wrapper(userPrompt, token, time_zone=None):
     # For now, just log the token to confirm it was passed correctly
     # print(f"Received token: {token}")
-    return ask_questions(llm, userPrompt, token)
+    if CHAT_MODE == "agent":
+        from agent import run_agent
+        return run_agent(get_llm(), userPrompt, token, time_zone)
+    return ask_questions(get_llm(), userPrompt, token, time_zone)
+
+def chat_stream_wrapper(userPrompt, token, time_zone=None):
+    if CHAT_MODE == "agent":
+        from agent import agent_events
+        return agent_events(get_llm(), userPrompt, token, time_zone)
+    return ask_questions_stream(get_llm(), userPrompt, token, time_zone)
 
 
 # ----------------- WEEKLY NEWSLETTER ------------------------------
 
-def get_weather_data(location="Dallas"):
+def weather_url(location="Dallas"):
     API_KEY = os.getenv("WEATHER_API_KEY")
-    url = f"https://api.tomorrow.io/v4/weather/forecast?location={location}&apikey={API_KEY}&timesteps=1d"
+    return f"https://api.tomorrow.io/v4/weather/forecast?location={location}&apikey={API_KEY}&timesteps=1d"
 
-
-    response = requests.get(url)
+def get_weather_data(location="Dallas"):
+    response = http_client.get(weather_url(location))
     try:
         return response.json()
     except Exception as e:
         print("Failed to parse weather response:", e)
         return {}
 
-def create_newsletter(llm, token, location="Dallas"):
-    # Step 1: Generate request for this week's events using the LLM
-    start_time, end_time, user_timezone = get_week_range_local()
-    question = "Get all calendar events from today to the upcoming Sunday"
-    relevant_data = query_pinecone(question)
-
-    calendar_prompt = (
-    "You are an assistant generating JSON requests to the Google Calendar API.\n"
-    "Generate but do not output a JSON request to retrieve all calendar events from today to the upcoming Sunday, "
-    "based on the user's current time zone.\n"
-    "Format the request with only the keys: `methods`, `URL`, and `params`.\n"
-    f"Start Time: {start_time}\nEnd Time: {end_time}\nTime Zone: {user_timezone}"
-    )
-
-    response = llm.invoke(calendar_prompt)
-    api_request_json = format_response(response)
-
-    # Add start & end time manually if not included
-    if "params" in api_request_json:
-        api_request_json["params"]["timeMin"] = start_time
-        api_request_json["params"]["timeMax"] = end_time
-
-    # Step 2: Fetch calendar events
-    calendar_data = call_calendar_api(api_request_json, token)
+# This week's events (or those in the given range), fetched with only the given fields
+def week_events_request(fields, start_time=None, end_time=None):
+    week_start, week_end, user_timezone = get_week_range_local()
+    start_time, end_time = start_time or week_start, end_time or week_end
+    return {
+        "methods": "GET",
+        "URL": PRIMARY_EVENTS_URL,
+        "params": {
+            "timeMin": start_time,
+            "timeMax": end_time,
+            "singleEvents": True,
+            "orderBy": "startTime",
+            "timeZone": user_timezone,
+            "fields": fields
+        }
+    }
 
-    # Step 3: Fetch weather data from Tomorrow.io
-    weather_data = get_weather_data(location)
+NEWSLETTER_EVENT_FIELDS = "items(summary,description,location,start,end)"
 
-    # Step 4: Ask LLM to generate a newsletter
-    newsletter_prompt = (
-    "Create a friendly and helpful weekly newsletter for the user. "
-    "Summarize calendar events and weather forecasts from today (Friday) through Sunday, grouped by day. "
-    "For each day, include a cheerful header, then list calendar events (with emojis and short descriptions), "
+# One day of the newsletter. The day's events and forecast come last, so the
+# instructions are a shared prefix and an unchanged day gives an identical prompt.
+def newsletter_section_prompt(day_label, events_text, weather_text):
+    return (
+    "Write one day's section of a friendly and helpful weekly newsletter for the user. "
+    "Start with a cheerful header for the day, then list its calendar events (with emojis and short descriptions), "
     "followed by the weather forecast (with high/low temperatures, conditions, and friendly suggestions). "
-    "Write in an engaging and warm tone with emoji and formatting where appropriate. Use bold for times, weather highlights, and section headers.\n\n"
-    f"Calendar Events JSON:\n{json.dumps(calendar_data, indent=4)}\n\n"
-    f"Weather Forecast JSON:\n{json.dumps(weather_data, indent=4)}"
+    "Write in an engaging and warm tone with emoji and formatting where appropriate. Use bold for times, weather highlights, and section headers. "
+    "Reply with the section only.\n\n"
+    "Events are listed one per line as time | title | details.\n\n"
+    f"Day: {day_label}\n\n"
+    f"Calendar Events:\n{events_text}\n\n"
+    f"Weather Forecast:\n{weather_text or '(no forecast)'}"
     )
 
-
-    final_response = llm.invoke(newsletter_prompt)
-    result = final_response.content if hasattr(final_response, 'content') else final_response
-
-    # print("\nWeekly Newsletter:\n")
-    print(result)
-    return result
-
+# Served from the stored per-day sections (newsletters.py)
 def newsletter_wrapper(token):
-    newsletter = create_newsletter(llm, token)
-    return newsletter
+    from newsletters import get_newsletter
+    return get_newsletter(token)
 
 # ------------------------- KANBAN BOARD -------------------------------
 
@@ -270,50 +565,109 @@ def format_events(response):
         return None
 
 
-def generate_weekly_todos(token):
-    # Get current week's start and end times using timezone-aware function
-    start_time, end_time, timezone = get_week_range_local()
+TODO_EVENT_FIELDS = "items(id,etag,summary,description,start,end)"
 
-    request_json = {
-        "methods": "GET",
-        "URL": "https://www.googleapis.com/calendar/v3/calendars/primary/events",
-        "params": {
-            "timeMin": start_time,
-            "timeMax": end_time,
-            "singleEvents": True,
-            "orderBy": "startTime",
-            "timeZone": timezone
-        }
-    }
+# "mapreduce" generates todos for small batches of events concurrently and
+# caches them per event (todo_cache.py); "single" asks for the whole week in one prompt
+KANBAN_MODE = os.getenv("KANBAN_MODE", "mapreduce")
+KANBAN_BATCH_SIZE = int(os.getenv("KANBAN_BATCH_SIZE", "6"))
+KANBAN_CONCURRENCY = int(os.getenv("KANBAN_CONCURRENCY", "4"))
 
-    # Call the Google Calendar API using the token and request
-    calendar_events = call_calendar_api(request_json, token)
+_todo_pool = ThreadPoolExecutor(max_workers=KANBAN_CONCURRENCY)
 
-    # Format todo generation prompt
-    todo_prompt = (
+# Returns (todos, complete); complete is False when some events' todos couldn't be generated
+def generate_weekly_todos(llm, token):
+    # Call the Google Calendar API for the current week's events
+    calendar_events = call_calendar_api(week_events_request(TODO_EVENT_FIELDS), token)
+    events = calendar_events.get('items', [])
+
+    if KANBAN_MODE == "mapreduce":
+        todos, complete = map_reduce_todos(llm, token, events)
+    else:
+        todos = format_events(invoke_llm(llm, todo_prompt(events), "kanban"))
+        complete = todos is not None
+
+    print(json.dumps(todos, indent=4))
+    return todos, complete
+
+# Format todo generation prompt. With ids the model echoes each event's id so
+# batch results can be matched back to their events.
+def todo_prompt(events, ids=False):
+    id_line = '  "id": "event id",\n' if ids else ""
+    return (
         "You are a productivity assistant helping organize a Kanban board based on calendar events.\n\n"
-        "You will receive a JSON array of calendar events scheduled between today and the upcoming Sunday. "
-        "For *each event* in the array, do the following:\n"
+        "You will receive a list of calendar events scheduled between today and the upcoming Sunday, "
+        f"one per line as {'[id] ' if ids else ''}time | title | details. "
+        "For *each event* in the list, do the following:\n"
         "1. Read the event's title and understand what it's about.\n"
         "2. Write a checklist of 2–5 related tasks that someone might need to do to prepare for or follow up on the event.\n"
         "3. Include this in the final list.\n\n"
         "Format your output as a list where each item is structured like:\n"
         "{\n"
+        f"{id_line}"
         '  "event": "event title",\n'
         '  "todos": ["task 1", "task 2", "task 3"]\n'
         "}\n\n"
         "**Process all events** in the list and do not skip any, even if they seem unimportant or repetitive.\n\n"
-        f"Here is the event list:\n{json.dumps(calendar_events['items'], indent=2)}\n\n"
+        f"Here is the event list:\n{events_block(events, ids=ids)}\n\n"
         "Now return the full list of todos in the specified format:"
     )
 
-    final_response = llm.invoke(todo_prompt)
-    todos = format_events(final_response)
-
-    print(json.dumps(todos, indent=4))
-    return todos
+def event_batches(events, size=KANBAN_BATCH_SIZE):
+    return [events[i:i + size] for i in range(0, len(events), size)]
+
+# Todos by event id from one batch's reply; falls back to the title when the model drops the id
+def match_todos(batch, items):
+    items = [item for item in items or [] if isinstance(item, dict)]
+    by_id = {item.get("id"): item for item in items}
+    by_title = {item.get("event"): item for item in items}
+    matched = {}
+    for event in batch:
+        item = by_id.get(event["id"]) or by_title.get(event.get("summary"))
+        if item is not None and isinstance(item.get("todos"), list):
+            matched[event["id"]] = item["todos"]
+    return matched
+
+# Map step: one LLM call per batch. Returns (todos by event id, ok); a failed
+# batch (an error or an unparseable reply) is left out of the board.
+def todos_for_batch(llm, batch):
+    try:
+        items = format_events(invoke_llm(llm, todo_prompt(batch, ids=True), "kanban"))
+    except Exception as e:
+        print(f"Todo batch of {len(batch)} events failed: {e}")
+        return {}, False
+    if items is None:
+        print(f"Todo batch of {len(batch)} events returned no usable list")
+        return {}, False
+    return match_todos(batch, items), True
+
+# Reduce step: one entry per event, in calendar order
+def merge_todos(events, todos_by_id):
+    return [
+        {"id": event["id"], "event": event.get("summary") or "(no title)", "todos": todos_by_id[event["id"]]}
+        for event in events
+        if event["id"] in todos_by_id
+    ]
+
+# Only events that are new or edited since their todos were generated go to
+# the model. Returns (board, complete): complete is False if any batch failed,
+# so the board isn't cached and the failed events are retried on the next request.
+def map_reduce_todos(llm, token, events):
+    todos_by_id = todo_cache.lookup(token, events)
+    missing = [event for event in events if event["id"] not in todos_by_id]
+
+    generated = {}
+    complete = True
+    for matched, ok in _todo_pool.map(lambda batch: todos_for_batch(llm, batch), event_batches(missing)):
+        generated.update(matched)
+        complete = complete and ok
+    if generated:
+        todo_cache.save(token, missing, generated)
+
+    todos_by_id.update(generated)
+    return merge_todos(events, todos_by_id), complete
 
 
 def kanban_wrapper(token):
-    todos = generate_weekly_todos(llm, token)
+    todos = cached_result("kanban", token, lambda: generate_weekly_todos(get_llm(), token))
     return todos
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import llm
+
+# Async wrappers for the ASGI server (asgi.py). Each endpoint has one
+# implementation, the one in llm.py; here it runs in a worker thread so the
+# event loop stays free while the model, Calendar or vector search is waited on.
+# Streamed answers are handed to the loop event by event as the thread yields them.
+
+_DONE = object()
+
+
+# Iterate a blocking iterator in a worker thread. If the consumer stops early
+# (e.g. the client disconnected), the thread stops at the next item.
+async def iterate_in_thread(make_iterator):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stopped = threading.Event()
+
+    def put(item, error=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+        except RuntimeError:
+            # The loop has closed; nobody is listening any more
+            stopped.set()
+
+    def produce():
+        iterator = None
+        try:
+            iterator = iter(make_iterator())
+            for item in iterator:
+                if stopped.is_set():
+                    return
+                put(item)
+            put(_DONE)
+        except Exception as e:
+            put(_DONE, e)
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+async def chat_wrapper(userPrompt, token, time_zone=None):
+    return await asyncio.to_thread(llm.chat_wrapper, userPrompt, token, time_zone)
+
+def chat_stream_wrapper(userPrompt, token, time_zone=None):
+    return iterate_in_thread(lambda: llm.chat_stream_wrapper(userPrompt, token, time_zone))
+
+async def newsletter_wrapper(token):
+    return await asyncio.to_thread(llm.newsletter_wrapper, token)
+
+async def kanban_wrapper(token):
+    return await asyncio.to_thread(llm.kanban_wrapper, token)
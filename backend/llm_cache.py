@@ -0,0 +1,89 @@
+import os
+import hashlib
+import threading
+from cachetools import TTLCache
+
+# Local cache of model replies for byte-identical prompts, plus per-endpoint
+# token accounting (including the provider's own prompt-cache hits).
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "600"))
+
+_replies = TTLCache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+_lock = threading.Lock()
+_stats = {}
+
+
+def model_id(llm):
+    return f"{getattr(llm, 'model_name', type(llm).__name__)}:{getattr(llm, 'temperature', '')}"
+
+
+def prompt_key(llm, prompt):
+    return hashlib.sha256(f"{model_id(llm)}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def _entry(endpoint):
+    return _stats.setdefault(endpoint, {
+        "calls": 0, "cache_hits": 0, "prompt_tokens": 0, "provider_cached_tokens": 0, "completion_tokens": 0,
+    })
+
+
+# Token usage as reported by the provider: langchain's usage_metadata, or
+# DeepSeek's prompt_cache_hit_tokens in the raw response
+def usage(message):
+    usage_metadata = getattr(message, "usage_metadata", None) or {}
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    cached = (usage_metadata.get("input_token_details") or {}).get("cache_read")
+    if cached is None:
+        cached = token_usage.get("prompt_cache_hit_tokens", 0)
+    return usage_metadata.get("input_tokens", 0), cached or 0, usage_metadata.get("output_tokens", 0)
+
+
+# Count tokens for a reply; count_call for model calls that bypass the cache (e.g. streamed)
+def record_usage(endpoint, message, count_call=False):
+    prompt_tokens, cached_tokens, completion_tokens = usage(message)
+    with _lock:
+        entry = _entry(endpoint)
+        entry["calls"] += int(count_call)
+        entry["prompt_tokens"] += prompt_tokens
+        entry["provider_cached_tokens"] += cached_tokens
+        entry["completion_tokens"] += completion_tokens
+
+
+def _lookup(endpoint, key):
+    with _lock:
+        entry = _entry(endpoint)
+        entry["calls"] += 1
+        reply = _replies.get(key)
+        if reply is not None:
+            entry["cache_hits"] += 1
+        return reply
+
+
+def _store(key, reply):
+    with _lock:
+        _replies[key] = reply
+
+
+# llm.invoke(prompt), answered from the cache when the same model saw the same prompt recently
+def invoke_llm(llm, prompt, endpoint):
+    key = prompt_key(llm, prompt)
+    reply = _lookup(endpoint, key)
+    if reply is None:
+        reply = llm.invoke(prompt)
+        record_usage(endpoint, reply)
+        _store(key, reply)
+    return reply
+
+
+def stats():
+    with _lock:
+        snapshot = {endpoint: dict(entry) for endpoint, entry in _stats.items()}
+        size = len(_replies)
+    endpoints = {}
+    for endpoint, entry in snapshot.items():
+        endpoints[endpoint] = dict(
+            entry,
+            hit_rate=round(entry["cache_hits"] / entry["calls"], 3) if entry["calls"] else 0.0,
+            cached_token_ratio=round(entry["provider_cached_tokens"] / entry["prompt_tokens"], 3) if entry["prompt_tokens"] else 0.0,
+        )
+    return {"entries": size, "max_entries": LLM_CACHE_SIZE, "endpoints": endpoints}
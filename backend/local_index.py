@@ -0,0 +1,112 @@
+import os
+import json
+import glob
+import hashlib
+import numpy as np
+from semantic_cache import bump_corpus_version
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DOCS_DIR = os.path.join(BASE_DIR, "Calendar Web Scrape JSON")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(BASE_DIR, "local_index"))
+
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.json"
+
+CHUNK_SIZE = 1000
+
+
+def chunk_id(source, text):
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()[:32]
+
+
+# Load the scraped Calendar reference docs as (source, url, content) tuples
+def load_documents(docs_dir=DOCS_DIR, paths=None):
+    if paths is None:
+        paths = sorted(glob.glob(os.path.join(docs_dir, "*.json")))
+
+    documents = []
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            doc = json.load(file)
+        documents.append((os.path.basename(path), doc.get("url", ""), doc.get("content", "")))
+    return documents
+
+
+# Split a document into chunks of whole lines, each at most ~chunk_size characters
+def chunk_text(text, chunk_size=CHUNK_SIZE):
+    chunks = []
+    current = []
+    current_len = 0
+
+    for line in text.split("\n"):
+        if current and current_len + len(line) + 1 > chunk_size:
+            chunks.append("\n".join(current))
+            current = []
+            current_len = 0
+        current.append(line)
+        current_len += len(line) + 1
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+# In-process replacement for the Pinecone index. Chunk embeddings live in a
+# memory-mapped float32 matrix with L2-normalized rows, so a top-k cosine
+# search is a single matrix-vector product.
+class LocalIndex:
+    def __init__(self, index_dir=LOCAL_INDEX_DIR):
+        vectors_path = os.path.join(index_dir, VECTORS_FILE)
+        chunks_path = os.path.join(index_dir, CHUNKS_FILE)
+        if not os.path.exists(vectors_path) or not os.path.exists(chunks_path):
+            raise FileNotFoundError(
+                f"No local index found in {index_dir}. Build it with `python ingest.py --target local`."
+            )
+
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        with open(chunks_path, encoding="utf-8") as file:
+            self.chunks = json.load(file)
+
+    # Mirrors pinecone.Index.query so callers can use either backend
+    def query(self, vector, top_k=5, include_metadata=True):
+        if len(self.chunks) == 0:
+            return {"matches": []}
+
+        query_vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm > 0:
+            query_vector = query_vector / norm
+
+        scores = self.vectors @ query_vector
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for i in top:
+            chunk = self.chunks[i]
+            match = {"id": chunk["id"], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = chunk["metadata"]
+            matches.append(match)
+        return {"matches": matches}
+
+
+def write_index(vectors, chunks, index_dir=LOCAL_INDEX_DIR):
+    os.makedirs(index_dir, exist_ok=True)
+
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(chunks), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
+
+    # Write to temp files and swap them in so a running server never maps a half-written file
+    vectors_tmp = os.path.join(index_dir, VECTORS_FILE + ".tmp")
+    chunks_tmp = os.path.join(index_dir, CHUNKS_FILE + ".tmp")
+    with open(vectors_tmp, "wb") as file:
+        np.save(file, matrix)
+    with open(chunks_tmp, "w", encoding="utf-8") as file:
+        json.dump(chunks, file, ensure_ascii=False)
+    os.replace(vectors_tmp, os.path.join(index_dir, VECTORS_FILE))
+    os.replace(chunks_tmp, os.path.join(index_dir, CHUNKS_FILE))
+    bump_corpus_version()
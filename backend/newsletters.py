@@ -0,0 +1,257 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from tzlocal import get_localzone
+import invalidation
+from event_store import user_key
+from event_projection import parse_time, events_block, weather_days
+from llm_cache import invoke_llm
+from llm import (
+    NEWSLETTER_EVENT_FIELDS, get_llm, call_calendar_api, get_weather_data, week_events_request,
+    newsletter_section_prompt, now_to_minute,
+)
+
+# Weekly newsletters, generated ahead of time. Each day from today through
+# Sunday is its own section, stored with a hash of the prompt it came from (that
+# day's events and forecast); a refresh regenerates only the days whose hash
+# changed. A background scheduler refreshes active users on a cadence and soon
+# after their calendar changes, so /llm/newsletter serves the stored copy. A
+# copy not checked within NEWSLETTER_REFRESH_INTERVAL (the scheduler is off,
+# the server restarted, the user's token lapsed) is refreshed on request.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NEWSLETTER_DB_PATH = os.getenv("NEWSLETTER_DB_PATH", os.path.join(BASE_DIR, "newsletters.sqlite"))
+NEWSLETTER_SCHEDULER = os.getenv("NEWSLETTER_SCHEDULER", "1") == "1"
+# Seconds between scheduled refreshes of each active user (picks up forecast changes)
+NEWSLETTER_REFRESH_INTERVAL = int(os.getenv("NEWSLETTER_REFRESH_INTERVAL", "3600"))
+# How often the scheduler looks for users that are due or whose calendar changed
+NEWSLETTER_TICK = int(os.getenv("NEWSLETTER_TICK", "30"))
+NEWSLETTER_CONCURRENCY = int(os.getenv("NEWSLETTER_CONCURRENCY", "4"))
+NEWSLETTER_LOCATION = os.getenv("NEWSLETTER_LOCATION", "Dallas")
+
+_db = None
+_init_lock = threading.Lock()
+_db_lock = threading.Lock()
+_lock = threading.Lock()
+_user_locks = {}
+_section_pool = ThreadPoolExecutor(max_workers=NEWSLETTER_CONCURRENCY)
+_scheduler_running = False
+
+# Last token per user who asked for a newsletter, for background refreshes.
+# Held in memory only, and long enough for the user to come due for a scheduled
+# refresh; a token that has expired by then fails that refresh and is dropped.
+_tokens = TTLCache(maxsize=4096, ttl=NEWSLETTER_REFRESH_INTERVAL + 2 * NEWSLETTER_TICK)
+_refreshed_at = {}
+# Users whose calendar changed since their last refresh
+_dirty = set()
+_counts = {"served_stored": 0, "generated_on_request": 0, "refreshes": 0, "sections_generated": 0, "sections_reused": 0}
+
+
+def db():
+    global _db
+    if _db is None:
+        with _init_lock:
+            if _db is None:
+                conn = sqlite3.connect(NEWSLETTER_DB_PATH, check_same_thread=False)
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sections ("
+                    "  user_key TEXT NOT NULL, day TEXT NOT NULL, digest TEXT NOT NULL, body TEXT NOT NULL,"
+                    "  generated_at REAL NOT NULL, PRIMARY KEY (user_key, day))"
+                )
+                conn.commit()
+                _db = conn
+    return _db
+
+
+def _user_lock(user):
+    with _lock:
+        return _user_locks.setdefault(user, threading.Lock())
+
+
+# Today through Sunday, as in the rest of the weekly views
+def week_days(tz):
+    today = now_to_minute(tz).date()
+    return [today + timedelta(days=i) for i in range(7 - today.weekday())]
+
+
+def day_bounds(day, tz):
+    start = datetime.combine(day, datetime.min.time(), tzinfo=tz)
+    return start, start + timedelta(days=1)
+
+
+# Events overlapping the day: timed events by their times, all-day events by their (exclusive-end) dates
+def events_on(day, events, tz):
+    day_start, day_end = day_bounds(day, tz)
+    selected = []
+    for event in events:
+        start, end = parse_time(event.get("start")), parse_time(event.get("end"))
+        if start is None:
+            continue
+        if isinstance(start, datetime):
+            end = end if isinstance(end, datetime) else start
+            if start < day_end and (end > day_start or start >= day_start):
+                selected.append(event)
+        elif start <= day < (end or start + timedelta(days=1)):
+            selected.append(event)
+    return selected
+
+
+def section_prompts(calendar_data, weather_data, days, tz):
+    events = calendar_data.get("items", [])
+    forecast = dict(weather_days(weather_data, tz))
+    return {
+        day: newsletter_section_prompt(f"{day:%A}, {day:%B} {day.day}", events_block(events_on(day, events, tz)), forecast.get(day))
+        for day in days
+    }
+
+
+def digest(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+# (digest, body, generated_at) by day. generated_at is when the section was
+# last checked against the day's events and forecast, not only when it was written.
+def load_sections(user, days):
+    with _db_lock:
+        rows = db().execute(
+            f"SELECT day, digest, body, generated_at FROM sections WHERE user_key = ? AND day IN ({','.join('?' * len(days))})",
+            (user, *[day.isoformat() for day in days]),
+        ).fetchall()
+    stored = {row[0]: tuple(row[1:]) for row in rows}
+    return {day: stored[day.isoformat()] for day in days if day.isoformat() in stored}
+
+
+# Save new sections, mark every remaining day as just checked and drop days that have passed
+def save_sections(user, sections, days, now):
+    with _db_lock:
+        db().executemany(
+            "INSERT OR REPLACE INTO sections VALUES (?, ?, ?, ?, ?)",
+            [(user, day.isoformat(), section_digest, body, now) for day, (section_digest, body, _) in sections.items()],
+        )
+        db().execute(
+            f"UPDATE sections SET generated_at = ? WHERE user_key = ? AND day IN ({','.join('?' * len(days))})",
+            (now, user, *[day.isoformat() for day in days]),
+        )
+        db().execute("DELETE FROM sections WHERE user_key = ? AND day < ?", (user, days[0].isoformat()))
+        db().commit()
+
+
+def assemble(days, sections):
+    return "\n\n".join(sections[day][1] for day in days if day in sections)
+
+
+def _generate_section(llm, prompt):
+    response = invoke_llm(llm, prompt, "newsletter")
+    return response.content if hasattr(response, 'content') else response
+
+
+# Rebuild the user's newsletter, regenerating only the days whose events or forecast changed
+def refresh(user, token, location=NEWSLETTER_LOCATION):
+    with _user_lock(user):
+        with _lock:
+            _dirty.discard(user)
+
+        tz = get_localzone()
+        days = week_days(tz)
+        time_min, time_max = day_bounds(days[0], tz)[0], day_bounds(days[-1], tz)[1]
+        calendar_data = call_calendar_api(
+            week_events_request(NEWSLETTER_EVENT_FIELDS, time_min.isoformat(), time_max.isoformat()), token
+        )
+        prompts = section_prompts(calendar_data, get_weather_data(location), days, tz)
+
+        sections = load_sections(user, days)
+        changed = [day for day in days if sections.get(day, (None,))[0] != digest(prompts[day])]
+        llm = get_llm()
+        bodies = _section_pool.map(lambda day: _generate_section(llm, prompts[day]), changed)
+        now = time.time()
+        generated = {day: (digest(prompts[day]), body, now) for day, body in zip(changed, bodies)}
+        save_sections(user, generated, days, now)
+        sections.update(generated)
+
+        with _lock:
+            _refreshed_at[user] = now
+            _counts["refreshes"] += 1
+            _counts["sections_generated"] += len(generated)
+            _counts["sections_reused"] += len(days) - len(generated)
+        print(f"Newsletter for {user}: regenerated {len(generated)} of {len(days)} days")
+        return assemble(days, sections)
+
+
+# The stored newsletter when it covers every remaining day of the week and was
+# checked within NEWSLETTER_REFRESH_INTERVAL. While the scheduler runs, a copy
+# whose calendar has since changed is still served and the scheduler catches
+# up within NEWSLETTER_TICK seconds.
+def get_newsletter(token):
+    user = user_key(token)
+    with _lock:
+        _tokens[user] = token
+        stale = user in _dirty and not _scheduler_running
+
+    days = week_days(get_localzone())
+    sections = load_sections(user, days)
+    checked_at = min((section[2] for section in sections.values()), default=0)
+    if time.time() - checked_at >= NEWSLETTER_REFRESH_INTERVAL:
+        stale = True
+    if not stale and len(sections) == len(days):
+        with _lock:
+            _counts["served_stored"] += 1
+        return assemble(days, sections)
+
+    with _lock:
+        _counts["generated_on_request"] += 1
+    return refresh(user, token)
+
+
+def _invalidate(user, token_hashes):
+    if user is not None:
+        with _lock:
+            _dirty.add(user)
+
+invalidation.register("newsletters", _invalidate)
+
+
+def due_users():
+    now = time.time()
+    with _lock:
+        for user in [user for user in _refreshed_at if user not in _tokens]:
+            del _refreshed_at[user]
+        return [
+            (user, token) for user, token in _tokens.items()
+            if user in _dirty or now - _refreshed_at.get(user, 0) >= NEWSLETTER_REFRESH_INTERVAL
+        ]
+
+
+def run_due():
+    for user, token in due_users():
+        try:
+            refresh(user, token)
+        except Exception as e:
+            # Most likely an expired token; the user's next request brings a new one
+            print(f"Refreshing newsletter for {user} failed: {e}")
+            with _lock:
+                if _tokens.get(user) == token:
+                    _tokens.pop(user, None)
+
+
+def start_scheduler():
+    global _scheduler_running
+
+    def loop():
+        while True:
+            time.sleep(NEWSLETTER_TICK)
+            run_due()
+
+    _scheduler_running = True
+    threading.Thread(target=loop, daemon=True).start()
+
+
+def stats():
+    with _db_lock:
+        sections = db().execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+    with _lock:
+        return dict(_counts, scheduler=_scheduler_running, active_users=len(_tokens), pending=len(_dirty), sections=sections)
@@ -0,0 +1,64 @@
+# Local stand-in for Google's push notifications: posts synthetic events.watch
+# notifications to /notifications/calendar so cache invalidation can be tested
+# without a public webhook URL.
+#
+#   python notification_standin.py --user me@example.com --create-channel
+#   python notification_standin.py --user me@example.com --count 3 --interval 1
+import time
+import uuid
+import secrets
+import argparse
+import requests
+import calendar_watch
+
+
+# Record a channel as if Google had opened it, for a server with no real watch
+def create_channel(user_key, ttl=calendar_watch.WATCH_TTL):
+    channel_id = str(uuid.uuid4())
+    resource_id = f"standin-{uuid.uuid4().hex[:12]}"
+    secret = secrets.token_urlsafe(24)
+    calendar_watch.add_channel(channel_id, user_key, resource_id, secret, time.time() + ttl)
+    return channel_id, resource_id, secret
+
+
+def find_channel(user_key):
+    channels = calendar_watch.channels_for(user_key)
+    if not channels:
+        return None
+    channel_id, resource_id, _ = max(channels, key=lambda c: c[2])
+    _, _, secret = calendar_watch.get_channel(channel_id)
+    return channel_id, resource_id, secret
+
+
+def post_notification(url, channel, state, number):
+    channel_id, resource_id, secret = channel
+    return requests.post(url, headers={
+        "X-Goog-Channel-ID": channel_id,
+        "X-Goog-Channel-Token": secret,
+        "X-Goog-Resource-ID": resource_id,
+        "X-Goog-Resource-State": state,
+        "X-Goog-Resource-URI": "https://www.googleapis.com/calendar/v3/calendars/primary/events",
+        "X-Goog-Message-Number": str(number),
+    }, timeout=10)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user", required=True, help="primary calendar id (email) of the user")
+    parser.add_argument("--url", default="http://localhost:5001/notifications/calendar")
+    parser.add_argument("--count", type=int, default=1, help="change notifications to send")
+    parser.add_argument("--interval", type=float, default=0.0)
+    parser.add_argument("--create-channel", action="store_true", help="record a stand-in channel first")
+    args = parser.parse_args()
+
+    channel = create_channel(args.user) if args.create_channel else find_channel(args.user)
+    if channel is None:
+        parser.error(f"No channel for {args.user} in {calendar_watch.WATCH_DB_PATH}; use --create-channel")
+
+    # Google opens every channel with a "sync" message, then sends "exists" per change
+    response = post_notification(args.url, channel, "sync", 1)
+    print(f"sync -> {response.status_code}")
+    for number in range(2, args.count + 2):
+        time.sleep(args.interval)
+        response = post_notification(args.url, channel, "exists", number)
+        print(f"exists #{number} -> {response.status_code}")
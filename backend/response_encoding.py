@@ -0,0 +1,87 @@
+import os
+import gzip
+import time
+import threading
+import orjson
+import zstandard
+
+# "on" compresses JSON responses when the client accepts zstd or gzip
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "on")
+# Below this, compression costs more than it saves
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+_zstd = threading.local()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _zstd_compressor():
+    # ZstdCompressor isn't thread-safe; keep one per thread
+    if not hasattr(_zstd, "compressor"):
+        _zstd.compressor = zstandard.ZstdCompressor(level=3)
+    return _zstd.compressor
+
+
+def choose_encoding(accept_encoding):
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def serialize(payload):
+    start = time.perf_counter()
+    body = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return body, (time.perf_counter() - start) * 1000
+
+
+# Serialize with orjson and compress if worthwhile. Returns the body and the
+# extra headers to send; timings go out as Server-Timing so each response shows its cost.
+def encode_json(payload, accept_encoding=None, endpoint=None):
+    body, serialize_ms = serialize(payload)
+    return encode_body(body, accept_encoding, endpoint, serialize_ms)
+
+
+# Compress already-serialized JSON for one client. Returns the body and headers.
+def encode_body(body, accept_encoding=None, endpoint=None, serialize_ms=0.0):
+    raw_bytes = len(body)
+    headers = {"X-Payload-Bytes": str(raw_bytes)}
+    timing = [f"serialize;dur={serialize_ms:.3f}"]
+    encoding = choose_encoding(accept_encoding) if RESPONSE_COMPRESSION == "on" else None
+    if encoding and raw_bytes >= COMPRESS_MIN_BYTES:
+        start = time.perf_counter()
+        body = _zstd_compressor().compress(body) if encoding == "zstd" else gzip.compress(body, compresslevel=5)
+        timing.append(f"compress;dur={(time.perf_counter() - start) * 1000:.3f}")
+        headers["Content-Encoding"] = encoding
+    headers["Vary"] = "Accept-Encoding"
+    headers["Server-Timing"] = ", ".join(timing)
+
+    _record(endpoint, raw_bytes, len(body), serialize_ms)
+    return body, headers
+
+
+def _record(endpoint, raw_bytes, sent_bytes, serialize_ms):
+    with _stats_lock:
+        entry = _stats.setdefault(endpoint or "other", {"responses": 0, "raw_bytes": 0, "sent_bytes": 0, "serialize_ms": 0.0})
+        entry["responses"] += 1
+        entry["raw_bytes"] += raw_bytes
+        entry["sent_bytes"] += sent_bytes
+        entry["serialize_ms"] += serialize_ms
+
+
+# Per-endpoint payload sizes and serialization time
+def stats():
+    with _stats_lock:
+        snapshot = {endpoint: dict(entry) for endpoint, entry in _stats.items()}
+    return {
+        endpoint: {
+            "responses": entry["responses"],
+            "avg_raw_bytes": round(entry["raw_bytes"] / entry["responses"]),
+            "avg_sent_bytes": round(entry["sent_bytes"] / entry["responses"]),
+            "avg_serialize_ms": round(entry["serialize_ms"] / entry["responses"], 3),
+        }
+        for endpoint, entry in snapshot.items()
+    }
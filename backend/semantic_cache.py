@@ -0,0 +1,108 @@
+import os
+import time
+import threading
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "256"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "600"))
+
+# Touched whenever the doc corpus is re-ingested; caches filled under an older version are dropped
+CORPUS_VERSION_PATH = os.getenv("CORPUS_VERSION_PATH", os.path.join(BASE_DIR, "corpus_version"))
+
+
+def corpus_version():
+    try:
+        return os.stat(CORPUS_VERSION_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def bump_corpus_version():
+    with open(CORPUS_VERSION_PATH, "w") as file:
+        file.write(str(time.time()))
+
+
+# Near-duplicate cache: a query whose embedding is within `threshold` cosine
+# similarity of a cached query reuses that query's retrieval results. Entries
+# live in fixed slots of a float32 matrix so a lookup is one dot product.
+class SemanticCache:
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, capacity=SEMANTIC_CACHE_SIZE, ttl=SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._reset()
+
+    def _reset(self):
+        self.vectors = None
+        self.values = [None] * self.capacity
+        self.expires = np.zeros(self.capacity)
+        self.last_used = np.zeros(self.capacity)
+
+    def invalidate(self):
+        with self.lock:
+            self._reset()
+
+    def _check_version(self, version):
+        if version != self.version:
+            self._reset()
+            self.version = version
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, vector, version=None):
+        with self.lock:
+            self._check_version(version)
+            now = time.monotonic()
+            live = self.expires > now
+            if self.vectors is None or not live.any():
+                self.misses += 1
+                return None
+
+            scores = self.vectors @ self._normalize(vector)
+            scores[~live] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.last_used[best] = now
+            self.hits += 1
+            return self.values[best]
+
+    def add(self, vector, value, version=None):
+        vector = self._normalize(vector)
+        with self.lock:
+            self._check_version(version)
+            if self.vectors is None:
+                self.vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+
+            now = time.monotonic()
+            free = np.flatnonzero(self.expires <= now)
+            # Reuse an empty or expired slot, otherwise evict the least recently used entry
+            slot = int(free[0]) if len(free) else int(np.argmin(self.last_used))
+
+            self.vectors[slot] = vector
+            self.values[slot] = value
+            self.expires[slot] = now + self.ttl
+            self.last_used[slot] = now
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": int((self.expires > time.monotonic()).sum()),
+                "threshold": self.threshold,
+            }
@@ -0,0 +1,194 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import intents
+from intents import find_event, parse_time, resolve_range, run_intent, title_words
+
+TZ = ZoneInfo("America/Chicago")
+# A Wednesday
+NOW = datetime(2025, 4, 9, 9, 30, tzinfo=TZ)
+
+
+def event(event_id, summary, start, end):
+    return {
+        "id": event_id,
+        "summary": summary,
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": end.isoformat()},
+    }
+
+
+def at(day, hour, minute=0):
+    return datetime(2025, 4, day, hour, minute, tzinfo=TZ)
+
+
+TEAM_SYNC = event("sync1", "Team sync", at(10, 15), at(10, 16))
+DENTIST = event("dent1", "Dentist", at(10, 9), at(10, 10))
+LUNCH = event("lunch1", "Lunch with Sam", at(10, 12), at(10, 13))
+
+
+class FakeApi:
+    def __init__(self, items, delete_result=None):
+        self.items = items
+        self.delete_result = {} if delete_result is None else delete_result
+        self.calls = []
+
+    def __call__(self, request_json, token):
+        self.calls.append(request_json)
+        if request_json["methods"] == "GET":
+            return {"items": self.items}
+        if request_json["methods"] == "DELETE":
+            return self.delete_result
+        return {"id": "new1", "summary": "created"}
+
+    def methods(self):
+        return [call["methods"] for call in self.calls]
+
+
+@pytest.fixture(autouse=True)
+def fixed_now(monkeypatch):
+    class FixedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return NOW.astimezone(tz) if tz else NOW
+
+    monkeypatch.setattr(intents, "datetime", FixedDatetime)
+
+
+# ---- Parsing ----
+
+@pytest.mark.parametrize("text, expected", [
+    ("3pm", (15, 0)),
+    ("12am", (0, 0)),
+    ("12:30 pm", (12, 30)),
+    ("at 9:15", (9, 15)),
+    ("noon", (12, 0)),
+    ("the dentist", None),
+])
+def test_parse_time(text, expected):
+    assert parse_time(text) == expected
+
+
+@pytest.mark.parametrize("text, start_day, end_day", [
+    ("today", 9, 10),
+    ("tomorrow", 10, 11),
+    ("on friday", 11, 12),
+    ("this week", 9, 14),
+    ("next week", 14, 21),
+    ("this weekend", 12, 14),
+])
+def test_resolve_range(text, start_day, end_day):
+    start, end = resolve_range(text, NOW)
+    assert (start.day, end.day) == (start_day, end_day)
+    assert start.hour == 0 and end.hour == 0
+
+
+def test_resolve_range_unknown():
+    assert resolve_range("what day of the week am i most free", NOW) is None
+
+
+def test_title_words_drop_filler_and_times():
+    assert title_words("my 3pm dentist appointment tomorrow") == ["dentist"]
+    assert title_words("the 10:00 meeting") == []
+
+
+# ---- Matching ----
+
+def test_find_event_by_time():
+    assert find_event([TEAM_SYNC, DENTIST], "my 3pm meeting", TZ) is TEAM_SYNC
+
+
+def test_find_event_by_title():
+    assert find_event([TEAM_SYNC, DENTIST], "the dentist appointment", TZ) is DENTIST
+
+
+def test_find_event_title_must_match_time_match():
+    # Only "Team sync" is at 3pm, but the user asked for the dentist
+    assert find_event([TEAM_SYNC, DENTIST], "my 3pm dentist appointment", TZ) is None
+
+
+def test_find_event_title_breaks_tie_between_time_matches():
+    other = event("sync2", "Dentist follow-up", at(10, 15), at(10, 16))
+    assert find_event([TEAM_SYNC, other], "my 3pm dentist appointment", TZ) is other
+
+
+def test_find_event_matches_whole_words():
+    party = event("party1", "Party", at(10, 18), at(10, 20))
+    assert find_event([party], "the art class", TZ) is None
+    assert find_event([party], "the party", TZ) is party
+
+
+def test_find_event_ambiguous():
+    other = event("sync2", "Team sync (backup)", at(10, 15), at(10, 16))
+    assert find_event([TEAM_SYNC, other], "my 3pm meeting", TZ) is None
+
+
+# ---- run_intent ----
+
+def test_delete_does_not_fall_back_to_time_only_match():
+    api = FakeApi([TEAM_SYNC])
+    assert run_intent("delete my 3pm dentist appointment tomorrow", "tok", TZ, api) is None
+    assert "DELETE" not in api.methods()
+
+
+def test_delete_matching_event():
+    api = FakeApi([TEAM_SYNC, DENTIST])
+    result = run_intent("Delete my 3pm meeting tomorrow", "tok", TZ, api)
+    assert result["deleted"] is True
+    assert result["event"]["summary"] == "Team sync"
+    assert api.calls[-1]["URL"].endswith("/sync1")
+
+
+def test_delete_failure_is_reported():
+    error = {"error": {"code": 404, "message": "Not Found"}}
+    result = run_intent("cancel the dentist tomorrow", "tok", TZ, FakeApi([DENTIST], delete_result=error))
+    assert result["deleted"] is False
+    assert result["error"] == error["error"]
+
+
+def test_delete_needs_a_time_or_title():
+    api = FakeApi([TEAM_SYNC])
+    assert run_intent("delete my meeting", "tok", TZ, api) is None
+    assert api.calls == []
+
+
+def test_add_uses_quick_add():
+    api = FakeApi([])
+    run_intent("Add Lunch with Sam tomorrow at noon to my calendar", "tok", TZ, api)
+    assert api.calls[0]["methods"] == "POST"
+    assert "quickAdd?text=Lunch%20with%20Sam%20tomorrow%20at%20noon" in api.calls[0]["URL"]
+
+
+def test_add_without_time_goes_to_llm():
+    api = FakeApi([])
+    assert run_intent("add a reminder to call mom", "tok", TZ, api) is None
+    assert api.calls == []
+
+
+@pytest.mark.parametrize("text", ["add dinner with Sam next week", "schedule a hike this weekend"])
+def test_add_without_a_concrete_day_goes_to_llm(text):
+    api = FakeApi([])
+    assert run_intent(text, "tok", TZ, api) is None
+    assert api.calls == []
+
+
+def test_add_on_a_weekday_uses_quick_add():
+    api = FakeApi([])
+    run_intent("schedule dinner with Sam on friday", "tok", TZ, api)
+    assert api.calls[0]["methods"] == "POST"
+
+
+def test_read_lists_range():
+    api = FakeApi([LUNCH])
+    assert run_intent("What do I have tomorrow?", "tok", TZ, api) == {"items": [LUNCH]}
+    params = api.calls[0]["params"]
+    assert params["timeMin"] == at(10, 0).isoformat()
+    assert params["timeMax"] == at(11, 0).isoformat()
+
+
+def test_unrecognized_question_goes_to_llm():
+    api = FakeApi([])
+    assert run_intent("How should I prepare for my interview?", "tok", TZ, api) is None
+    assert api.calls == []
@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from event_store import user_key
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TODO_CACHE_PATH = os.getenv("TODO_CACHE_PATH", os.path.join(BASE_DIR, "todo_cache.sqlite"))
+# Entries for events not seen in this many days are pruned
+TODO_CACHE_MAX_AGE = int(os.getenv("TODO_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+
+# Generated kanban todos per event, keyed by (user, event id, etag). Google
+# changes an event's etag whenever the event is edited, so a stored entry is
+# reused exactly as long as the event it was generated from is unchanged.
+
+_db = None
+_init_lock = threading.Lock()
+_db_lock = threading.Lock()
+_counts = {"hits": 0, "misses": 0, "stored": 0}
+
+
+def db():
+    global _db
+    if _db is None:
+        with _init_lock:
+            if _db is None:
+                conn = sqlite3.connect(TODO_CACHE_PATH, check_same_thread=False)
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS todos ("
+                    "  user_key TEXT NOT NULL, event_id TEXT NOT NULL, etag TEXT NOT NULL,"
+                    "  todos TEXT NOT NULL, seen_at REAL NOT NULL, PRIMARY KEY (user_key, event_id))"
+                )
+                conn.commit()
+                _db = conn
+    return _db
+
+
+# Todos for each event whose stored etag still matches, by event id
+def lookup(token, events):
+    user = user_key(token)
+    found = {}
+    with _db_lock:
+        for event in events:
+            row = db().execute(
+                "SELECT etag, todos FROM todos WHERE user_key = ? AND event_id = ?", (user, event["id"])
+            ).fetchone()
+            if row is not None and event.get("etag") and row[0] == event["etag"]:
+                found[event["id"]] = json.loads(row[1])
+        db().execute(
+            f"UPDATE todos SET seen_at = ? WHERE user_key = ? AND event_id IN ({','.join('?' * len(found))})",
+            (time.time(), user, *found),
+        )
+        db().commit()
+        _counts["hits"] += len(found)
+        _counts["misses"] += len(events) - len(found)
+    return found
+
+
+# Store freshly generated todos for the events that have them; events without an etag aren't cached
+def save(token, events, todos_by_id):
+    user = user_key(token)
+    now = time.time()
+    rows = [
+        (user, event["id"], event["etag"], json.dumps(todos_by_id[event["id"]]), now)
+        for event in events
+        if event.get("etag") and event["id"] in todos_by_id
+    ]
+    with _db_lock:
+        db().executemany("INSERT OR REPLACE INTO todos VALUES (?, ?, ?, ?, ?)", rows)
+        db().execute("DELETE FROM todos WHERE user_key = ? AND seen_at < ?", (user, now - TODO_CACHE_MAX_AGE))
+        db().commit()
+        _counts["stored"] += len(rows)
+
+
+def stats():
+    with _db_lock:
+        entries = db().execute("SELECT COUNT(*) FROM todos").fetchone()[0]
+        return dict(_counts, entries=entries)